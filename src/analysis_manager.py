@@ -0,0 +1,178 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from threading import RLock
+
+from src.subprocesses.analyze_intent import analyze_intent_batch
+from src.subprocesses.analyze_meaning import identify_meaning_many
+
+
+class AnalysisManagerMeta(type):
+   _instances = {}
+
+   @classmethod
+   def __call__(mcs, *args, **kwargs):
+      if mcs not in mcs._instances:
+         instance = super().__call__(AnalysisManager, *args, **kwargs)
+         mcs._instances[mcs] = instance
+      return mcs._instances[mcs]
+
+
+@dataclass
+class MessageAnalysis:
+   msg_id: str
+   meaning: dict
+   intent: dict
+
+
+def message_id(m: dict) -> str:
+   """The message's own id, else the same content hash the STM dedupe uses."""
+   if m.get("id"):
+      return m["id"]
+   from src.nodes.n03_memory.n01_stm_node import compute_msg_id
+   return compute_msg_id(m)
+
+
+class AnalysisManager(metaclass=AnalysisManagerMeta):
+   """
+   identify_meaning + analyze_intent once per message:
+     - Results are memoized by (message id, reference date) in an LRU of ANALYSIS_CACHE_SIZE entries (default
+       4096). Relative dates ("tomorrow") resolve against that date, so a new day re-analyzes instead of serving
+       yesterday's dates; old days age out of the LRU.
+     - attach() writes them into message["metadata"] ("meaning", "intent"), where ThreadTracker and
+       build_system_message read them; lookup() serves readers that only have the message.
+     - Misses of one call are analyzed together (spaCy pipe + batched classifier), outside the lock, so sessions
+       only wait for each other on the cache bookkeeping.
+     - A failed analysis is remembered for ANALYSIS_FAILURE_TTL seconds (default 30) and not retried every turn.
+     - stats() counts hits, misses and analyses: with no evictions, analyses == distinct messages seen per day
+       (two sessions missing the same message at the same moment may both analyze it).
+   """
+   cache: OrderedDict
+   failures: dict[tuple[str, str], float]
+   max_entries: int
+   failure_ttl: float
+   counters: dict[str, int]
+
+   def __init__(self):
+      self.cache = OrderedDict()
+      self.failures = {}
+      self.max_entries = int(os.environ.get("ANALYSIS_CACHE_SIZE", 4096))
+      self.failure_ttl = float(os.environ.get("ANALYSIS_FAILURE_TTL", 30))
+      self.counters = {"hits": 0, "misses": 0, "analyses": 0, "evictions": 0, "errors": 0, "failure_hits": 0}
+      self.last_error: str | None = None
+      self.meaning_many = identify_meaning_many
+      self.intent_batch = analyze_intent_batch
+      self.clock = datetime.utcnow
+      self._lock = RLock()
+
+   @staticmethod
+   def _key(msg_id: str, now: datetime) -> tuple[str, str]:
+      return msg_id, now.date().isoformat()
+
+   def lookup(self, m: dict) -> MessageAnalysis | None:
+      """Cached analysis of a message for today, never computed here."""
+      key = self._key(message_id(m), self.clock())
+      with self._lock:
+         found = self.cache.get(key)
+         if found is not None:
+            self.cache.move_to_end(key)
+            self.counters["hits"] += 1
+         return found
+
+   def analyze_many(self, messages: list[dict]) -> list[MessageAnalysis | None]:
+      """One analysis per message, in order; None where the analyzers failed (see last_error)."""
+      now = self.clock()
+      keys = [self._key(message_id(m), now) for m in messages]
+      found: dict[tuple[str, str], MessageAnalysis | None] = {}
+      missing: dict[tuple[str, str], str] = {}
+      with self._lock:
+         for key, m in zip(keys, messages):
+            if key in self.cache:
+               self.cache.move_to_end(key)
+               self.counters["hits"] += 1
+               found[key] = self.cache[key]
+            elif self.failures.get(key, 0.0) > time.monotonic():
+               self.counters["failure_hits"] += 1
+            else:
+               self.counters["misses"] += 1
+               missing.setdefault(key, m.get("content") or "")
+      if missing:
+         found.update(self._compute(missing, now))
+      return [found.get(key) for key in keys]
+
+   def analyze(self, m: dict) -> MessageAnalysis | None:
+      return self.analyze_many([m])[0]
+
+   def attach(self, messages: list[dict]) -> list[dict]:
+      """Analyzes the messages and stores meaning/intent in their metadata (created if absent)."""
+      for m, analysis in zip(messages, self.analyze_many(messages)):
+         if analysis is not None:
+            metadata = m.setdefault("metadata", {})
+            metadata["meaning"], metadata["intent"] = analysis.meaning, analysis.intent
+      return messages
+
+   def _compute(self, texts: dict[tuple[str, str], str], now: datetime) -> dict[tuple[str, str], MessageAnalysis]:
+      """Runs the models without holding the lock; only the results are inserted under it."""
+      try:
+         meanings = list(self.meaning_many(texts.values(), now=now))
+         intents = self.intent_batch(list(texts.values()), meanings)
+      except Exception as e:
+         # models missing or failing: leave the messages unanalyzed for failure_ttl, readers treat that as "no meaning/intent"
+         with self._lock:
+            self.counters["errors"] += 1
+            if self.last_error is None:
+               print(f"analysis_manager: analysis failed: {e!r}")
+            self.last_error = repr(e)
+            self._prune_failures()
+            self.failures.update(dict.fromkeys(texts, time.monotonic() + self.failure_ttl))
+         return {}
+      computed = {key: MessageAnalysis(msg_id=key[0], meaning=meaning, intent=intent)
+                  for key, meaning, intent in zip(texts, meanings, intents)}
+      with self._lock:
+         for key, analysis in computed.items():
+            self.cache[key] = analysis
+            self.failures.pop(key, None)
+            self.counters["analyses"] += 1
+         while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+            self.counters["evictions"] += 1
+         self._prune_failures()
+      return computed
+
+   def _prune_failures(self):
+      now = time.monotonic()
+      for key in [k for k, retry_at in self.failures.items() if retry_at <= now]:
+         del self.failures[key]
+
+   def clear(self):
+      with self._lock:
+         self.cache.clear()
+         self.failures.clear()
+
+   def stats(self) -> dict:
+      with self._lock:
+         return {**self.counters, "cached": len(self.cache), "failed": len(self.failures),
+                 "max_entries": self.max_entries, "last_error": self.last_error}
+
+
+if __name__ == '__main__':
+   from src.prompt_manager import ThreadTracker, _missing_slots, _title_from, build_system_message
+
+   am = AnalysisManager()
+   texts = ["Can you fix the deploy of service 3 by tomorrow?", "thanks, that works", "What is the SLA for step 2?",
+            "Please write a summary and mail it to ops@example.com", "ok"]
+   history = [{"role": "user", "content": texts[i % len(texts)] + f" (#{i % 40})"} for i in range(200)]
+
+   started = time.perf_counter()
+   for m in history:
+      # prompt building analyzes the current turn; repeated content is a cache hit
+      build_system_message(message=m)
+   tracker = ThreadTracker().consume_many(history)
+   for m in history:
+      _title_from(m), _missing_slots(m), am.lookup(m)
+   stats = am.stats()
+   print(f"{(time.perf_counter() - started) * 1e3:.0f} ms, {len(tracker.open_threads())} open threads")
+   print(stats)
+   assert stats["analyses"] == len({m["content"] for m in history}), "a message was analyzed more than once"
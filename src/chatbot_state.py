@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import TypedDict
+from typing import Callable, TypedDict
 from dataclasses import dataclass
 from concurrent.futures import Future
 from langchain_core.messages import BaseMessage, AIMessage
@@ -24,11 +24,36 @@ class ProcessingTask:
    result: str | None
    task: Future | None | str
    historyCheckpoint: int
+   version: int = 0
+
+
+@dataclass
+class GenerationStats:
+   tokens: int
+   time_to_first_token: float
+   duration: float
+   tokens_per_sec: float
+
+
+@dataclass
+class ContextStats:
+   tokens_in: int
+   history_tokens: int
+   kept_messages: int
+   dropped_messages: int
+   dropped_tokens: int
+   budget: int
+   utilisation: float
 
 
 class ChatbotState(TypedDict):
+   thread_id: str
    persona: str
    user_input: RawInput | None
    output_message: AIMessage | None
    history: list[BaseMessage]
    stmMemory: ProcessingTask
+   generationStats: GenerationStats | None
+   contextStats: ContextStats | None
+   # receives the streamed reply token by token; None prints to stdout
+   output_sink: Callable[[str], None] | None
@@ -0,0 +1,124 @@
+import os
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from langchain_core.messages import BaseMessage
+
+from src.chatbot_state import ContextStats
+
+# role/separator tokens the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base"):
+   """tiktoken encoding, or None when tiktoken or its BPE file is unavailable (then counts fall back to len/3)."""
+   try:
+      import tiktoken
+      return tiktoken.get_encoding(name)
+   except Exception:
+      return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+   if not text:
+      return 0
+   encoding = get_encoding(encoding_name)
+   if encoding is None:
+      return int(len(text) / 3)
+   return len(encoding.encode(text, disallowed_special=()))
+
+
+class ContextManagerMeta(type):
+   _instances = {}
+
+   @classmethod
+   def __call__(mcs, *args, **kwargs):
+      if mcs not in mcs._instances:
+         instance = super().__call__(ContextManager, *args, **kwargs)
+         mcs._instances[mcs] = instance
+      return mcs._instances[mcs]
+
+
+@dataclass
+class TokenLedger:
+   """Token count of every history message of one thread, counted once, plus running prefix sums."""
+   messages: list[BaseMessage] = field(default_factory=list)
+   prefix: list[int] = field(default_factory=lambda: [0])
+
+   def sync(self, history: list[BaseMessage]):
+      # history only grows by appends; anything else (truncation, rewrite) recounts from scratch
+      known = len(self.messages)
+      if known > len(history) or (known and history[known - 1] is not self.messages[-1]):
+         self.messages, self.prefix, known = [], [0], 0
+      for message in history[known:]:
+         self.messages.append(message)
+         self.prefix.append(self.prefix[-1] + MESSAGE_OVERHEAD + count_tokens(message_text(message)))
+
+
+def message_text(message: BaseMessage) -> str:
+   return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class ContextManager(metaclass=ContextManagerMeta):
+   """
+   Fits the chat history into the model's context window:
+     - budget = context_tokens - response_tokens - system prompt - current input.
+     - Keeps the newest messages that fit; the window never starts with an assistant reply.
+     - Per-message counts are cached per thread, so a turn only tokenizes messages appended since the last one
+       and the cut point is a binary search over prefix sums.
+   Sizes come from CONTEXT_TOKENS / RESPONSE_TOKENS (defaults 4096 / 512).
+   """
+   context_tokens: int
+   response_tokens: int
+   ledgers: dict[str, TokenLedger]
+
+   def __init__(self):
+      self.context_tokens = int(os.environ.get("CONTEXT_TOKENS", 4096))
+      self.response_tokens = int(os.environ.get("RESPONSE_TOKENS", 512))
+      self.ledgers = {}
+
+   def drop_thread(self, thread_id: str):
+      self.ledgers.pop(thread_id, None)
+
+   @staticmethod
+   @lru_cache(maxsize=64)
+   def _count_system(system: str) -> int:
+      # the system prompt only changes when the STM text does
+      return MESSAGE_OVERHEAD + count_tokens(system)
+
+   def fit(self, thread_id: str, history: list[BaseMessage], system: str, input_str: str) -> tuple[list[BaseMessage], ContextStats]:
+      ledger = self.ledgers.setdefault(thread_id, TokenLedger())
+      ledger.sync(history)
+      fixed = self._count_system(system) + MESSAGE_OVERHEAD + count_tokens(input_str)
+      budget = max(self.context_tokens - self.response_tokens - fixed, 0)
+      total = ledger.prefix[-1]
+      # first index whose suffix (prefix[-1] - prefix[i]) fits the budget
+      start = bisect_left(ledger.prefix, total - budget)
+      while start < len(history) and history[start].type == "ai":
+         start += 1
+      kept = total - ledger.prefix[start]
+      stats = ContextStats(tokens_in=fixed + kept,
+                           history_tokens=kept,
+                           kept_messages=len(history) - start,
+                           dropped_messages=start,
+                           dropped_tokens=ledger.prefix[start],
+                           budget=budget,
+                           utilisation=kept / budget if budget else 1.0)
+      return history[start:], stats
+
+
+if __name__ == '__main__':
+   import time
+   from langchain_core.messages import AIMessage, HumanMessage
+
+   cm = ContextManager()
+   history = []
+   started = time.perf_counter()
+   for turn in range(2000):
+      history += [HumanMessage(content=f"Question {turn}: how do I fix step {turn % 7} of the deploy?"),
+                  AIMessage(content=f"Answer {turn}: " + "check the logs and retry. " * 10)]
+      window, stats = cm.fit("bench", history, system="You are a helpful assistant.", input_str="next")
+   print(f"{(time.perf_counter() - started) * 1e3 / 2000:.3f} ms/turn at {len(history)} messages, encoding={get_encoding() is not None}")
+   print(stats)
@@ -1,3 +1,5 @@
+import asyncio
+import sys
 from multiprocessing import Queue, Process
 
 
@@ -24,6 +26,24 @@ class InputManager(metaclass=InputManagerMeta):
       self.process = Process(target=external_input, args=(self.queue,))
       self.process.start()
 
+   @staticmethod
+   async def read_line(timeout: float) -> str | None:
+      """Await one line from stdin without blocking the event loop; None on timeout."""
+      loop = asyncio.get_running_loop()
+      line = loop.create_future()
+
+      def on_readable():
+         if not line.done():
+            line.set_result(sys.stdin.readline())
+
+      loop.add_reader(sys.stdin.fileno(), on_readable)
+      try:
+         return await asyncio.wait_for(line, timeout)
+      except asyncio.TimeoutError:
+         return None
+      finally:
+         loop.remove_reader(sys.stdin.fileno())
+
 
 def external_input(queue: Queue):
    import time
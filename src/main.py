@@ -1,26 +1,33 @@
+import asyncio
+
 from chatbot_state import ChatbotState, ProcessingTask
 from workflow import Workflow
 from util.cancellation_token import CancellationToken
-from subprocess_manager import SubprocessManager
+# the nodes import it as src.*; the same module means the same singleton, so shutdown() stops the real pool
+from src.subprocess_manager import SubprocessManager
 
 
 def main():
    ct = CancellationToken()
    state = ChatbotState(
+      thread_id="default",
       persona="assistant",
       history=[],
       user_input=None,
       output_message=None,
-      stmMemory=ProcessingTask(name='stm', result=None, task=None, historyCheckpoint=0)
+      stmMemory=ProcessingTask(name='stm', result=None, task=None, historyCheckpoint=0),
+      generationStats=None,
+      contextStats=None,
+      output_sink=None
    )
    workflow = Workflow(cancellation_token=ct)
    try:
       sm = SubprocessManager()
-      state = workflow.run(state, itearation_limit=5)
+      state = asyncio.run(workflow.arun(state, itearation_limit=5))
    except KeyboardInterrupt:
       ct.cancel()
    finally:
-      del sm
+      sm.shutdown()
    print(f"final state:\n{state}")
    for m in state['history']:
       print(m.content)
@@ -1,5 +1,6 @@
 from concurrent.futures import ProcessPoolExecutor
 
+from src.prompt_manager import ParcelIndex
 from src.subprocesses.extract_facts import extract_facts
 
 
@@ -15,42 +16,93 @@ class MemoryManagerMeta(type):
 
 
 class MemoryManager(metaclass=MemoryManagerMeta):
-   STM: list[dict]
+   STM: dict[str, list[dict]]
+   parcels: dict[str, ParcelIndex]
+   rendered: dict[str, str]
+   versions: dict[str, int]
+   summaries: dict[str, str]
+   summarized: dict[str, int]
 
    def __init__(self):
-      self.STM = []
+      self.STM = {}
+      self.parcels = {}
+      self.rendered = {}
+      self.versions = {}
+      self.summaries = {}
+      self.summarized = {}
 
-   def store_stm(self, memories):
-      self.STM.extend(memories)
+   def store_stm(self, memories, thread_id: str = "default"):
+      self.STM.setdefault(thread_id, []).extend(memories)
+      index = self.parcels.setdefault(thread_id, ParcelIndex())
+      for mem in memories:
+         drafts = mem.get("parcels_draft") or []
+         for draft in drafts:
+            index.add({**draft, "source": {"timestamp": draft.get("last_seen")}})
+         if any(index.has_conflict(str(d.get("subject", "user")), str(d.get("predicate", ""))) for d in drafts):
+            mem.setdefault("flags", {})["memory_conflict"] = True
+      # render only the new memories and append them to the cached text
+      lines = [line for mem in memories for line in self.render_memory(mem)]
+      if lines:
+         previous = self.rendered.get(thread_id, "")
+         self.rendered[thread_id] = previous + ("\n" if previous else "") + "\n".join(lines)
+      self.versions[thread_id] = self.versions.get(thread_id, 0) + 1
 
-   def summarize_memory(self):
-      memories = self.STM
+   def drop_stm(self, thread_id: str):
+      self.STM.pop(thread_id, None)
+      self.parcels.pop(thread_id, None)
+      self.rendered.pop(thread_id, None)
+      self.summaries.pop(thread_id, None)
+      self.summarized.pop(thread_id, None)
+      self.versions[thread_id] = self.versions.get(thread_id, 0) + 1
+
+   def store_summary(self, summary: str, upto: int, thread_id: str = "default"):
+      """Running summary of history[:upto]; late results for an older range are ignored."""
+      if upto > self.summarized.get(thread_id, 0):
+         self.summaries[thread_id] = summary
+         self.summarized[thread_id] = upto
+
+   def session_summary(self, thread_id: str = "default") -> str:
+      return self.summaries.get(thread_id, "")
+
+   def summarized_upto(self, thread_id: str = "default") -> int:
+      return self.summarized.get(thread_id, 0)
+
+   def parcel_index(self, thread_id: str = "default") -> ParcelIndex:
+      return self.parcels.setdefault(thread_id, ParcelIndex())
+
+   def version(self, thread_id: str = "default") -> int:
+      return self.versions.get(thread_id, 0)
+
+   def summarize_memory(self, thread_id: str = "default"):
+      return self.rendered.get(thread_id, "")
+
+   @staticmethod
+   def render_memory(mem: dict) -> list[str]:
       lines = []
-      for i, mem in enumerate(memories, 1):
-         ctx = mem.get("context", {})
-         prefs = mem.get("prefs", {})
-         facts = mem.get("facts", [])
-         flags = mem.get("flags", {})
-
-         # Context
-         ctx_bits = [f"{k}={v}" for k, v in ctx.items() if v]
-         if ctx_bits:
-            lines.append("Context: " + ", ".join(ctx_bits))
-
-         # Preferences
-         if prefs.get("likes") or prefs.get("dislikes"):
-            likes = ", ".join(prefs.get("likes", []))
-            dislikes = ", ".join(prefs.get("dislikes", []))
-            if likes: lines.append("Likes: " + likes)
-            if dislikes: lines.append("Dislikes: " + dislikes)
-
-         # Facts
-         for f in facts:
-            line = f"- {f['predicate'].upper()} ({f.get('entity') or 'n/a'}): {f['value']} "
-            line += f"(conf={f['confidence']:.2f}, stab={f['stability']:.2f}, seen={f['last_seen']})"
-            fact_flags = [k for k, v in flags.items() if v]
-            if fact_flags:
-               line += " | Flags: " + ", ".join(fact_flags)
-            lines.append(line)
-
-      return "\n".join(lines)
+      ctx = mem.get("context", {})
+      prefs = mem.get("prefs", {})
+      facts = mem.get("facts", [])
+      flags = mem.get("flags", {})
+
+      # Context
+      ctx_bits = [f"{k}={v}" for k, v in ctx.items() if v]
+      if ctx_bits:
+         lines.append("Context: " + ", ".join(ctx_bits))
+
+      # Preferences
+      if prefs.get("likes") or prefs.get("dislikes"):
+         likes = ", ".join(prefs.get("likes", []))
+         dislikes = ", ".join(prefs.get("dislikes", []))
+         if likes: lines.append("Likes: " + likes)
+         if dislikes: lines.append("Dislikes: " + dislikes)
+
+      # Facts
+      for f in facts:
+         line = f"- {f['predicate'].upper()} ({f.get('entity') or 'n/a'}): {f['value']} "
+         line += f"(conf={f['confidence']:.2f}, stab={f['stability']:.2f}, seen={f['last_seen']})"
+         fact_flags = [k for k, v in flags.items() if v]
+         if fact_flags:
+            line += " | Flags: " + ", ".join(fact_flags)
+         lines.append(line)
+
+      return lines
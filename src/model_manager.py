@@ -1,9 +1,12 @@
 import os
+from dataclasses import dataclass
+from typing import Iterator, AsyncIterator
 from langchain_core.language_models import BaseLLM
 from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage
 from langchain_core.output_parsers import BaseTransformOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
 from langchain_ollama.llms import OllamaLLM
 
 
@@ -18,15 +21,34 @@ class ModelManagerMeta(type):
       return mcs._instances[mcs]
 
 
+@dataclass
+class CompiledChain:
+   chain: Runnable
+   template: str
+   stm_memory: str | None
+   session_summary: str | None
+   system: SystemMessage
+
+
 class ModelManager(metaclass=ModelManagerMeta):
    avaible_models: dict[str, BaseLLM]
    parser: BaseTransformOutputParser
    templates: dict[(str, str), str]
+   chains: dict[(str, str, str), CompiledChain]
+   chain_hits: int
+   chain_misses: int
 
    def __init__(self):
       self.parser = StrOutputParser()
       self.avaible_models = {'lexi': OllamaLLM(model="lexi")}
-      self.templates = {}
+      self.chains = {}
+      self.chain_hits = 0
+      self.chain_misses = 0
+      self.templates = self.load_templates()
+
+   @staticmethod
+   def load_templates() -> dict[(str, str), str]:
+      templates = {}
       if os.path.exists('personas'):
          personas = os.listdir('personas')
          for persona in personas:
@@ -36,19 +58,71 @@ class ModelManager(metaclass=ModelManagerMeta):
                   continue
                template_name = template_file.split('.')[0]
                with open(f'personas/{persona}/{template_file}', 'r') as fp:
-                  self.templates[(persona, template_name)] = fp.read()
+                  templates[(persona, template_name)] = fp.read()
+      return templates
+
+   def reload_templates(self):
+      """Re-read persona templates from disk and drop compiled chains whose template changed."""
+      templates = self.load_templates()
+      for (persona, template_name), template in self.templates.items():
+         if templates.get((persona, template_name)) != template:
+            self.invalidate_chains(persona=persona, template_name=template_name)
+      self.templates = templates
+
+   def invalidate_chains(self, model_name: str | None = None, persona: str | None = None, template_name: str | None = None):
+      for key in list(self.chains):
+         if model_name in (None, key[0]) and persona in (None, key[1]) and template_name in (None, key[2]):
+            del self.chains[key]
+
+   def chain_cache_stats(self) -> dict:
+      return {"size": len(self.chains), "hits": self.chain_hits, "misses": self.chain_misses}
 
    @staticmethod
-   def format_prompt(prompt: str, stm_memory: str):
+   def format_prompt(prompt: str, stm_memory: str, session_summary: str | None = None):
       prompt = prompt.replace("$STM_MEMORY$", stm_memory if stm_memory else "")
+      prompt = prompt.replace("{{session_summary}}", session_summary if session_summary else "")
       return prompt
 
-   def invoke(self, model_name: str, persona: str, template_name: str, input_str: str, history: list[BaseMessage], stm_memory: str) -> str:
-      sys_prompt = self.templates[(persona, template_name)]
-      sys_prompt = self.format_prompt(sys_prompt, stm_memory)
-      prompt = ChatPromptTemplate.from_messages([SystemMessage(content=sys_prompt)] + history +
-                                                [MessagesPlaceholder(variable_name="messages")])
-      chain = prompt | self.avaible_models[model_name] | self.parser
-      inputs = {"messages": [HumanMessage(content=input_str[input_str.index(':') + 1:])]}
+   def _build_chain(self, model_name: str, persona: str, template_name: str, input_str: str, history: list[BaseMessage], stm_memory: str, session_summary: str | None = None):
+      key = (model_name, persona, template_name)
+      template = self.templates[(persona, template_name)]
+      compiled = self.chains.get(key)
+      if compiled is None or compiled.template is not template:
+         self.chain_misses += 1
+         prompt = ChatPromptTemplate.from_messages([MessagesPlaceholder(variable_name="system"),
+                                                    MessagesPlaceholder(variable_name="history"),
+                                                    MessagesPlaceholder(variable_name="messages")])
+         compiled = CompiledChain(chain=prompt | self.avaible_models[model_name] | self.parser,
+                                  template=template,
+                                  stm_memory=stm_memory,
+                                  session_summary=session_summary,
+                                  system=SystemMessage(content=self.format_prompt(template, stm_memory, session_summary)))
+         self.chains[key] = compiled
+      else:
+         self.chain_hits += 1
+         if compiled.stm_memory != stm_memory or compiled.session_summary != session_summary:
+            compiled.stm_memory = stm_memory
+            compiled.session_summary = session_summary
+            compiled.system = SystemMessage(content=self.format_prompt(template, stm_memory, session_summary))
+      inputs = {"system": [compiled.system],
+                "history": history,
+                "messages": [HumanMessage(content=input_str[input_str.index(':') + 1:])]}
+      return compiled.chain, inputs
+
+   def invoke(self, model_name: str, persona: str, template_name: str, input_str: str, history: list[BaseMessage], stm_memory: str, session_summary: str | None = None) -> str:
+      chain, inputs = self._build_chain(model_name, persona, template_name, input_str, history, stm_memory, session_summary)
       output = chain.invoke(inputs)
       return output
+
+   def invoke_stream(self, model_name: str, persona: str, template_name: str, input_str: str, history: list[BaseMessage], stm_memory: str, session_summary: str | None = None) -> Iterator[str]:
+      """Same as invoke, but yields the reply token by token as the model produces it."""
+      chain, inputs = self._build_chain(model_name, persona, template_name, input_str, history, stm_memory, session_summary)
+      for chunk in chain.stream(inputs):
+         if chunk:
+            yield chunk
+
+   async def astream(self, model_name: str, persona: str, template_name: str, input_str: str, history: list[BaseMessage], stm_memory: str, session_summary: str | None = None) -> AsyncIterator[str]:
+      chain, inputs = self._build_chain(model_name, persona, template_name, input_str, history, stm_memory, session_summary)
+      async for chunk in chain.astream(inputs):
+         if chunk:
+            yield chunk
@@ -4,22 +4,24 @@ import sys
 from src.input_manager import InputManager
 
 
-
 class InputNode:
 
    @staticmethod
-   def get_input(state: ChatbotState) -> ChatbotState:
+   def _prepare() -> tuple[InputManager, int]:
       im = InputManager()
       if im.process is None:
          im.simulate_external_input()
       ready, _, _ = select.select([sys.stdin], [], [], 0)
       if ready:
          sys.stdin.readline()
-      print('>', end='')
+      print('>', end='', flush=True)
       timeout = 30 if not im.queue.empty() else 60
-      ready, _, _ = select.select([sys.stdin], [], [], timeout)
-      if ready:
-         state['user_input'] = RawInput(content=sys.stdin.readline().rstrip('\n'), source=InputSource.TEXT)
+      return im, timeout
+
+   @staticmethod
+   def _resolve(state: ChatbotState, im: InputManager, line: str | None) -> ChatbotState:
+      if line is not None:
+         state['user_input'] = RawInput(content=line.rstrip('\n'), source=InputSource.TEXT)
       elif not im.queue.empty():
          auto_prompt = im.queue.get_nowait()
          print(auto_prompt)
@@ -28,3 +30,15 @@ class InputNode:
          print('no input')
          state['user_input'] = RawInput(content='No input provided', source=InputSource.SYSTEM)
       return state
+
+   @staticmethod
+   def get_input(state: ChatbotState) -> ChatbotState:
+      im, timeout = InputNode._prepare()
+      ready, _, _ = select.select([sys.stdin], [], [], timeout)
+      return InputNode._resolve(state, im, sys.stdin.readline() if ready else None)
+
+   @staticmethod
+   async def aget_input(state: ChatbotState) -> ChatbotState:
+      im, timeout = InputNode._prepare()
+      line = await im.read_line(timeout)
+      return InputNode._resolve(state, im, line)
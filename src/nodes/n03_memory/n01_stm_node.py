@@ -1,14 +1,24 @@
 from __future__ import annotations
 from langchain_core.messages import HumanMessage
 from src.chatbot_state import ChatbotState, ProcessingTask
+from abc import ABC, abstractmethod
+from threading import Lock, RLock
 from typing import List, Dict, Optional, Callable
+import asyncio
 import json
+import os
 import time
 import hashlib
-import redis
+import uuid
 import re
 
+try:
+   import redis
+except ImportError:  # only RedisSTMStorage needs it
+   redis = None
+
 from src.memory_manager import MemoryManager
+from src.util.archive_writer import ArchiveWriter
 from src.subprocess_manager import SubprocessManager
 
 
@@ -54,49 +64,129 @@ def compute_msg_id(m: Dict) -> str:
 
 # Atomic: dedupe (SET in seen set), append, trim, expire — all or nothing.
 IDEMPOTENT_APPEND_LUA = """
--- KEYS[1] = list key, KEYS[2] = seen set key
--- ARGV[1] = msg_json, ARGV[2] = msg_id, ARGV[3] = max_messages, ARGV[4] = ttl
+-- KEYS[1] = list key, KEYS[2] = seen set key, KEYS[3] = sequence counter key, KEYS[4] = epoch key
+-- ARGV[1] = msg_json, ARGV[2] = msg_id, ARGV[3] = max_messages, ARGV[4] = ttl, ARGV[5] = fresh epoch token
 if redis.call('SISMEMBER', KEYS[2], ARGV[2]) == 1 then return 0 end
 redis.call('SADD', KEYS[2], ARGV[2])
 redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('INCR', KEYS[3])
+redis.call('SET', KEYS[4], ARGV[5], 'NX')
 local maxm = tonumber(ARGV[3]) or 0
 if maxm > 0 then redis.call('LTRIM', KEYS[1], -maxm, -1) end
 local ttl = tonumber(ARGV[4]) or 0
 if ttl > 0 then
   redis.call('EXPIRE', KEYS[1], ttl)
   redis.call('EXPIRE', KEYS[2], ttl)
+  redis.call('EXPIRE', KEYS[3], ttl)
+  redis.call('EXPIRE', KEYS[4], ttl)
 end
 return 1
 """
 
+# Batch variant: same guarantees for a whole list of messages in one round trip.
+# Returns one 1/0 per message (appended / duplicate), in input order.
+IDEMPOTENT_APPEND_BATCH_LUA = """
+-- KEYS[1] = list key, KEYS[2] = seen set key, KEYS[3] = sequence counter key, KEYS[4] = epoch key
+-- ARGV[1] = max_messages, ARGV[2] = ttl, ARGV[3] = fresh epoch token, ARGV[4..] = msg_id, msg_json pairs
+local out = {}
+local appended = 0
+for i = 4, #ARGV, 2 do
+  if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[i + 1])
+    appended = appended + 1
+    out[#out + 1] = 1
+  else
+    out[#out + 1] = 0
+  end
+end
+if appended > 0 then
+  redis.call('INCRBY', KEYS[3], appended)
+  redis.call('SET', KEYS[4], ARGV[3], 'NX')
+  local maxm = tonumber(ARGV[1]) or 0
+  if maxm > 0 then redis.call('LTRIM', KEYS[1], -maxm, -1) end
+  local ttl = tonumber(ARGV[2]) or 0
+  if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+    redis.call('EXPIRE', KEYS[3], ttl)
+    redis.call('EXPIRE', KEYS[4], ttl)
+  end
+end
+return out
+"""
+
+# Incremental read: every appended message gets the next sequence number (the counter never goes back when
+# LTRIM drops old entries), so the list holds seqs total-len+1 .. total and "since" maps to a list offset.
+# The first append after a clear or expiry starts a new epoch (a random token set with NX), so a caller holding
+# a seq from an earlier epoch gets everything again instead of a tail spliced onto stale messages.
+# Counter, epoch and list are read in the same atomic call. Returns {total, epoch, items newer than ARGV[1]}.
+LOAD_SINCE_LUA = """
+-- KEYS[1] = list key, KEYS[2] = sequence counter key, KEYS[3] = epoch key
+-- ARGV[1] = last sequence number the caller has seen, ARGV[2] = epoch of that number ('' = don't check)
+local len = redis.call('LLEN', KEYS[1])
+local total = tonumber(redis.call('GET', KEYS[2]) or 0) or 0
+if total < len then total = len end
+local epoch = redis.call('GET', KEYS[3]) or ''
+local start = tonumber(ARGV[1]) - (total - len)
+if ARGV[2] ~= '' and ARGV[2] ~= epoch then start = 0 end
+if start < 0 then start = 0 end
+if start >= len then return {total, epoch, {}} end
+return {total, epoch, redis.call('LRANGE', KEYS[1], start, -1)}
+"""
+
+# Server-side deep merge of the slots JSON blob + TTL refresh in one atomic call.
+# Mirrors _deep_merge: nested objects merge, everything else (scalars, arrays, null) replaces.
+# Note: cjson cannot tell an empty array from an empty object, so empties may round-trip as the other kind.
+MERGE_SLOTS_LUA = """
+-- KEYS[1] = slots key
+-- ARGV[1] = slots patch json, ARGV[2] = ttl
+local function is_object(t)
+  return type(t) == 'table' and (next(t) == nil or t[1] == nil)
+end
+local function merge(a, b)
+  for k, v in pairs(b) do
+    if is_object(v) and is_object(a[k]) then
+      a[k] = merge(a[k], v)
+    else
+      a[k] = v
+    end
+  end
+  return a
+end
+local raw = redis.call('GET', KEYS[1])
+local current = raw and cjson.decode(raw) or {}
+local merged = cjson.encode(merge(current, cjson.decode(ARGV[1])))
+redis.call('SET', KEYS[1], merged)
+local ttl = tonumber(ARGV[2]) or 0
+if ttl > 0 then redis.call('EXPIRE', KEYS[1], ttl) end
+return merged
+"""
+
 
 # ---- Storage ---------------------------------------------------------------
 
-class RedisSTMStorage:
+class STMStorage(ABC):
    """
-   Redis-backed STM:
-     - Messages stored as a Redis LIST per thread (lossless).
-     - Idempotent appends via Lua + a per-thread SEEN set.
-     - TTL & LTRIM guardrails.
-     - Slots stored as a small JSON blob (merge-on-write).
-     - Optional archive sink for durable logs (e.g., S3/SQL/file).
+   Short-term memory store, one idempotent message log + one slots blob per thread.
+   Backends share the semantics below (see tests/test_stm_storage.py):
+     - Appends are deduped by message id; the SEEN set is never trimmed, so a trimmed message stays a duplicate.
+     - The log keeps the newest max_messages; every append bumps a per-thread sequence counter.
+     - Any append that adds something refreshes the TTL of messages/seen/seq (Redis: and epoch); merge_slots refreshes the slots TTL.
    """
 
    def __init__(
          self,
-         url: str = "redis://localhost:6379/0",
          prefix: str = "stm:",
          ttl: Optional[int] = 24 * 3600,
          max_messages: int = 200,
          archive_sink: Optional[Callable[[List[Dict], str], None]] = None,
-         decode_responses: bool = True,
+         batch_size: int = 500,
    ):
-      self.r = redis.from_url(url, decode_responses=decode_responses)
       self.prefix = prefix
       self.ttl = ttl
       self.max_messages = max_messages
       self.archive_sink = archive_sink
-      self._append_script = self.r.register_script(IDEMPOTENT_APPEND_LUA)
+      self.batch_size = batch_size
 
    # --- Keys
    def k_messages(self, thread_id: str) -> str:
@@ -108,56 +198,235 @@ class RedisSTMStorage:
    def k_slots(self, thread_id: str) -> str:
       return f"{self.prefix}slots:{thread_id}"
 
+   def k_seq(self, thread_id: str) -> str:
+      return f"{self.prefix}seq:{thread_id}"
+
+   def k_epoch(self, thread_id: str) -> str:
+      return f"{self.prefix}epoch:{thread_id}"
+
    # --- Messages
-   def append_messages_idempotent(self, thread_id: str, msgs: List[Dict]) -> int:
-      """
-      Append messages atomically with dedupe.
-      Returns count of newly appended (non-duplicate) messages.
-      """
-      if not msgs:
-         return 0
-      list_key, seen_key = self.k_messages(thread_id), self.k_seen(thread_id)
-      appended = 0
-      now = time.time()
-      appended_batch: List[Dict] = []
+   @staticmethod
+   def _prepare(msgs: List[Dict], now: float) -> List[tuple]:
+      prepared = []
       for m in msgs:
          m = {**m, "ts": m.get("ts", now)}
          mid = m.get("id") or compute_msg_id(m)
-         payload = json.dumps(m, separators=(",", ":"))
-         res = self._append_script(
-            keys=[list_key, seen_key],
-            args=[payload, mid, self.max_messages or 0, self.ttl or 0]
-         )
-         if int(res) == 1:
-            appended += 1
-            appended_batch.append(m)
-
-      if appended and self.archive_sink:
+         prepared.append((m, mid, json.dumps(m, separators=(",", ":"))))
+      return prepared
+
+   def _archive(self, thread_id: str, prepared: List[tuple], outcomes: List[bool]) -> None:
+      appended_batch = [m for (m, _, _), ok in zip(prepared, outcomes) if ok]
+      if appended_batch and self.archive_sink:
          try:
             self.archive_sink(appended_batch, thread_id)
          except Exception:
             pass
 
+   @abstractmethod
+   def append_messages_batch(self, thread_id: str, msgs: List[Dict]) -> List[bool]:
+      """Append with dedupe; per-message outcomes, True if appended, False if it was a duplicate."""
+
+   def append_messages_idempotent(self, thread_id: str, msgs: List[Dict]) -> int:
+      """
+      Append messages atomically with dedupe.
+      Returns count of newly appended (non-duplicate) messages.
+      """
+      return sum(self.append_messages_batch(thread_id, msgs))
+
+   def append_messages_pipelined(self, batches: Dict[str, List[Dict]]) -> Dict[str, List[bool]]:
+      """Append batches for several threads at once."""
+      return {tid: self.append_messages_batch(tid, msgs) for tid, msgs in batches.items() if msgs}
+
+   @abstractmethod
+   def load_messages(self, thread_id: str, last_n: Optional[int] = None) -> List[Dict]:
+      """All stored messages, or only the newest last_n."""
+
+   @abstractmethod
+   def load_since(self, thread_id: str, seq: int = 0) -> tuple[int, List[Dict]]:
+      """Messages appended after sequence number `seq`, plus the current sequence number."""
+
+   def load_recent(self, thread_id: str, k: int = 16) -> List[Dict]:
+      """The newest k messages, for get_recent_window-style callers."""
+      return self.load_messages(thread_id, last_n=k) if k > 0 else []
+
+   @abstractmethod
+   def clear_messages(self, thread_id: str) -> None:
+      """Drop messages, seen set and sequence counter."""
+
+   # --- Slots
+   @abstractmethod
+   def merge_slots(self, thread_id: str, new_slots: Dict) -> Dict:
+      """Deep-merge new_slots into the stored slots and refresh the TTL. Returns the merged slots."""
+
+   @abstractmethod
+   def get_slots(self, thread_id: str) -> Dict:
+      pass
+
+   @abstractmethod
+   def clear_slots(self, thread_id: str) -> None:
+      pass
+
+   def clear_all(self, thread_id: str) -> None:
+      """Blow away messages, seen set, and slots for this thread."""
+      self.clear_messages(thread_id)
+      self.clear_slots(thread_id)
+
+
+_pools: Dict[tuple, "redis.ConnectionPool"] = {}
+_pools_lock = Lock()
+
+
+def shared_connection_pool(url: str, decode_responses: bool = True) -> "redis.ConnectionPool":
+   """One pool per (url, decode_responses) per process, shared by every RedisSTMStorage."""
+   key = (url, decode_responses)
+   with _pools_lock:
+      if key not in _pools:
+         _pools[key] = redis.ConnectionPool.from_url(url, decode_responses=decode_responses)
+      return _pools[key]
+
+
+class RedisSTMStorage(STMStorage):
+   """
+   Redis-backed STM:
+     - Messages stored as a Redis LIST per thread (lossless).
+     - Idempotent appends via Lua + a per-thread SEEN set, one script call per batch.
+     - Per-thread sequence counter: tail reads and "since seq N" reads, plus a local decoded-message cache
+       that only fetches and decodes what was appended since the last load.
+     - TTL & LTRIM guardrails.
+     - Slots stored as a small JSON blob, deep-merged server-side (atomic, one round trip).
+     - Optional archive sink for durable logs (e.g., S3/SQL/file).
+     - Connections come from a process-wide pool shared by all instances with the same url.
+   """
+
+   def __init__(
+         self,
+         url: str = "redis://localhost:6379/0",
+         prefix: str = "stm:",
+         ttl: Optional[int] = 24 * 3600,
+         max_messages: int = 200,
+         archive_sink: Optional[Callable[[List[Dict], str], None]] = None,
+         decode_responses: bool = True,
+         batch_size: int = 500,
+         pool: Optional["redis.ConnectionPool"] = None,
+   ):
+      if redis is None:
+         raise ImportError("RedisSTMStorage needs the 'redis' package; use InMemorySTMStorage without it")
+      super().__init__(prefix=prefix, ttl=ttl, max_messages=max_messages, archive_sink=archive_sink, batch_size=batch_size)
+      self.r = redis.Redis(connection_pool=pool or shared_connection_pool(url, decode_responses))
+      self._append_script = self.r.register_script(IDEMPOTENT_APPEND_LUA)
+      self._append_batch_script = self.r.register_script(IDEMPOTENT_APPEND_BATCH_LUA)
+      self._merge_slots_script = self.r.register_script(MERGE_SLOTS_LUA)
+      self._load_since_script = self.r.register_script(LOAD_SINCE_LUA)
+      # thread_id -> (epoch, last seen seq, decoded messages), see load_messages_cached
+      self._decoded: Dict[str, tuple] = {}
+
+   def _message_keys(self, thread_id: str) -> list:
+      return [self.k_messages(thread_id), self.k_seen(thread_id), self.k_seq(thread_id), self.k_epoch(thread_id)]
+
+   # --- Messages
+   def _batch_args(self, prepared: List[tuple]) -> list:
+      args = [self.max_messages or 0, self.ttl or 0, uuid.uuid4().hex]
+      for _, mid, payload in prepared:
+         args += [mid, payload]
+      return args
+
+   def append_messages_batch(self, thread_id: str, msgs: List[Dict]) -> List[bool]:
+      """
+      Append messages atomically with dedupe, one script call per `batch_size` messages.
+      Returns per-message outcomes: True if appended, False if it was a duplicate.
+      """
+      if not msgs:
+         return []
+      keys = self._message_keys(thread_id)
+      prepared = self._prepare(msgs, time.time())
+      outcomes: List[bool] = []
+      for i in range(0, len(prepared), self.batch_size):
+         chunk = prepared[i:i + self.batch_size]
+         res = self._append_batch_script(keys=keys, args=self._batch_args(chunk))
+         outcomes += [int(r) == 1 for r in res]
+      self._archive(thread_id, prepared, outcomes)
+      return outcomes
+
+   def append_messages_pipelined(self, batches: Dict[str, List[Dict]]) -> Dict[str, List[bool]]:
+      """
+      Multi-thread ingestion: one batch script call per thread, all sent in a single pipeline round trip.
+      Each thread's batch is still atomic; batches of different threads are independent.
+      """
+      now = time.time()
+      prepared = {tid: self._prepare(msgs, now) for tid, msgs in batches.items() if msgs}
+      pipe = self.r.pipeline(transaction=False)
+      for tid, items in prepared.items():
+         self._append_batch_script(keys=self._message_keys(tid), args=self._batch_args(items), client=pipe)
+      results = pipe.execute()
+      outcomes = {}
+      for (tid, items), res in zip(prepared.items(), results):
+         outcomes[tid] = [int(r) == 1 for r in res]
+         self._archive(tid, items, outcomes[tid])
+      return outcomes
+
+   def _append_sequential(self, thread_id: str, msgs: List[Dict]) -> int:
+      """Previous one-EVALSHA-per-message path, kept as the benchmark baseline."""
+      keys = self._message_keys(thread_id)
+      appended = 0
+      for _, mid, payload in self._prepare(msgs, time.time()):
+         res = self._append_script(keys=keys, args=[payload, mid, self.max_messages or 0, self.ttl or 0, uuid.uuid4().hex])
+         appended += int(res) == 1
       return appended
 
-   def load_messages(self, thread_id: str) -> List[Dict]:
-      raw = self.r.lrange(self.k_messages(thread_id), 0, -1)
+   def load_messages(self, thread_id: str, last_n: Optional[int] = None) -> List[Dict]:
+      """All stored messages, or only the newest last_n (a tail LRANGE, nothing older is sent or decoded)."""
+      if last_n is not None and last_n <= 0:
+         return []
+      raw = self.r.lrange(self.k_messages(thread_id), -last_n if last_n else 0, -1)
       return [json.loads(x) for x in raw]
 
+   def load_since(self, thread_id: str, seq: int = 0) -> tuple[int, List[Dict]]:
+      """
+      Messages appended after sequence number `seq`, plus the current sequence number to pass next time.
+      Messages already trimmed away by max_messages are skipped silently.
+      """
+      _, total, fresh = self._load_since(thread_id, seq)
+      return total, fresh
+
+   def _load_since(self, thread_id: str, seq: int, epoch: str = "") -> tuple[str, int, List[Dict]]:
+      keys = [self.k_messages(thread_id), self.k_seq(thread_id), self.k_epoch(thread_id)]
+      total, current, raw = self._load_since_script(keys=keys, args=[seq, epoch])
+      return current, int(total), [json.loads(x) for x in raw]
+
+   def load_messages_cached(self, thread_id: str) -> List[Dict]:
+      """
+      Same content as load_messages(), served from a local decoded copy; only the entries appended since the
+      previous call travel over the wire and get decoded. The returned list is shared, do not mutate it.
+      """
+      epoch, seq, cached = self._decoded.get(thread_id, ("", 0, []))
+      current, total, fresh = self._load_since(thread_id, seq, epoch)
+      if current != epoch:
+         # new epoch: the thread was cleared or expired behind our back, fresh holds everything stored now
+         cached = []
+      if fresh:
+         cached.extend(fresh)
+         if self.max_messages and len(cached) > self.max_messages:
+            del cached[:len(cached) - self.max_messages]
+      self._decoded[thread_id] = (current, total, cached)
+      return cached
+
+   def load_recent(self, thread_id: str, k: int = 16) -> List[Dict]:
+      return self.load_messages_cached(thread_id)[-k:] if k > 0 else []
+
+   def forget_cached(self, thread_id: str) -> None:
+      self._decoded.pop(thread_id, None)
+
    def clear_messages(self, thread_id: str) -> None:
-      self.r.delete(self.k_messages(thread_id))
-      self.r.delete(self.k_seen(thread_id))
+      self.r.delete(*self._message_keys(thread_id))
+      self.forget_cached(thread_id)
 
-   def merge_slots(self, thread_id: str, new_slots: Dict) -> None:
+   def merge_slots(self, thread_id: str, new_slots: Dict) -> Dict:
+      """Deep-merge new_slots into the stored slots and refresh the TTL; safe with concurrent writers. Returns the merged slots."""
       if not new_slots:
-         return
-      key = self.k_slots(thread_id)
-
-      current = self.get_slots(thread_id)
-      merged = _deep_merge(current, new_slots)
-      self.r.set(key, json.dumps(merged, separators=(",", ":")))
-      if self.ttl:
-         self.r.expire(key, self.ttl)
+         return self.get_slots(thread_id)
+      merged = self._merge_slots_script(keys=[self.k_slots(thread_id)],
+                                        args=[json.dumps(new_slots, separators=(",", ":")), self.ttl or 0])
+      return json.loads(merged)
 
    def get_slots(self, thread_id: str) -> Dict:
       raw = self.r.get(self.k_slots(thread_id))
@@ -167,30 +436,210 @@ class RedisSTMStorage:
       self.r.delete(self.k_slots(thread_id))
 
    def clear_all(self, thread_id: str) -> None:
-      """Blow away messages, seen set, and slots for this thread."""
-      self.r.delete(self.k_messages(thread_id), self.k_seen(thread_id), self.k_slots(thread_id))
+      self.r.delete(*self._message_keys(thread_id), self.k_slots(thread_id))
+      self.forget_cached(thread_id)
+
+
+class InMemorySTMStorage(STMStorage):
+   """
+   In-process STM with the same dedupe/trim/TTL semantics as RedisSTMStorage, no server needed.
+   For tests, benchmarks and single-process bots; state lives in this instance only and
+   TTLs expire lazily on access. Messages are kept as JSON so loads return fresh copies, like Redis.
+   """
+
+   def __init__(
+         self,
+         prefix: str = "stm:",
+         ttl: Optional[int] = 24 * 3600,
+         max_messages: int = 200,
+         archive_sink: Optional[Callable[[List[Dict], str], None]] = None,
+         batch_size: int = 500,
+         clock: Callable[[], float] = time.monotonic,
+   ):
+      super().__init__(prefix=prefix, ttl=ttl, max_messages=max_messages, archive_sink=archive_sink, batch_size=batch_size)
+      self.clock = clock
+      self._data: Dict[str, object] = {}
+      self._expires: Dict[str, float] = {}
+      self._lock = RLock()
+
+   def _get(self, key: str, default=None):
+      deadline = self._expires.get(key)
+      if deadline is not None and deadline <= self.clock():
+         self._delete(key)
+      return self._data.get(key, default)
+
+   def _expire(self, *keys: str) -> None:
+      if self.ttl:
+         deadline = self.clock() + self.ttl
+         for key in keys:
+            self._expires[key] = deadline
+
+   def _delete(self, *keys: str) -> None:
+      for key in keys:
+         self._data.pop(key, None)
+         self._expires.pop(key, None)
+
+   # --- Messages
+   def append_messages_batch(self, thread_id: str, msgs: List[Dict]) -> List[bool]:
+      if not msgs:
+         return []
+      list_key, seen_key, seq_key = self.k_messages(thread_id), self.k_seen(thread_id), self.k_seq(thread_id)
+      prepared = self._prepare(msgs, time.time())
+      outcomes: List[bool] = []
+      with self._lock:
+         log, seen = self._get(list_key, []), self._get(seen_key, set())
+         for _, mid, payload in prepared:
+            if mid in seen:
+               outcomes.append(False)
+               continue
+            seen.add(mid)
+            log.append(payload)
+            outcomes.append(True)
+         appended = sum(outcomes)
+         if appended:
+            if self.max_messages and len(log) > self.max_messages:
+               del log[:len(log) - self.max_messages]
+            self._data[list_key], self._data[seen_key] = log, seen
+            self._data[seq_key] = self._get(seq_key, 0) + appended
+            self._expire(list_key, seen_key, seq_key)
+      self._archive(thread_id, prepared, outcomes)
+      return outcomes
+
+   def load_messages(self, thread_id: str, last_n: Optional[int] = None) -> List[Dict]:
+      if last_n is not None and last_n <= 0:
+         return []
+      with self._lock:
+         log = self._get(self.k_messages(thread_id), [])
+         raw = log[-last_n:] if last_n else list(log)
+      return [json.loads(x) for x in raw]
+
+   def load_since(self, thread_id: str, seq: int = 0) -> tuple[int, List[Dict]]:
+      with self._lock:
+         log = self._get(self.k_messages(thread_id), [])
+         total = max(self._get(self.k_seq(thread_id), 0), len(log))
+         raw = log[max(seq - (total - len(log)), 0):]
+      return total, [json.loads(x) for x in raw]
+
+   def clear_messages(self, thread_id: str) -> None:
+      with self._lock:
+         self._delete(self.k_messages(thread_id), self.k_seen(thread_id), self.k_seq(thread_id))
+
+   # --- Slots
+   def merge_slots(self, thread_id: str, new_slots: Dict) -> Dict:
+      if not new_slots:
+         return self.get_slots(thread_id)
+      key = self.k_slots(thread_id)
+      with self._lock:
+         raw = self._get(key)
+         merged = json.dumps(_deep_merge(json.loads(raw) if raw else {}, new_slots), separators=(",", ":"))
+         # like SET: a fresh value drops the old TTL before the new one is applied
+         self._delete(key)
+         self._data[key] = merged
+         self._expire(key)
+      return json.loads(merged)
+
+   def get_slots(self, thread_id: str) -> Dict:
+      with self._lock:
+         raw = self._get(self.k_slots(thread_id))
+      return json.loads(raw) if raw else {}
+
+   def clear_slots(self, thread_id: str) -> None:
+      with self._lock:
+         self._delete(self.k_slots(thread_id))
+
+
+STM_BACKENDS: Dict[str, type] = {
+   "redis": RedisSTMStorage,
+   "memory": InMemorySTMStorage,
+}
+
+
+def create_stm_storage(config: Optional[Dict] = None) -> STMStorage:
+   """
+   Build the configured STM backend from {"backend": "redis" | "memory", **constructor kwargs}.
+   Without a backend the STM_BACKEND environment variable decides (default "redis"); STM_REDIS_URL sets the url.
+   "archive_dir" attaches a background ArchiveWriter writing rotating .jsonl.gz segments there.
+   """
+   config = dict(config or {})
+   if config.get("archive_dir"):
+      config["archive_sink"] = ArchiveWriter(config.pop("archive_dir"))
+   config.pop("archive_dir", None)
+   backend = config.pop("backend", None) or os.environ.get("STM_BACKEND", "redis")
+   if backend not in STM_BACKENDS:
+      raise ValueError(f"Unknown STM backend {backend!r}, expected one of {sorted(STM_BACKENDS)}")
+   if backend == "redis" and "url" not in config and os.environ.get("STM_REDIS_URL"):
+      config["url"] = os.environ["STM_REDIS_URL"]
+   return STM_BACKENDS[backend](**config)
 
 
 class StmNode:
    @staticmethod
    def retrieve_stm(state: ChatbotState) -> ChatbotState:
       sm = SubprocessManager()
-      pt = sm.queue_task(state['stmMemory'], state['history'])
-      memories = MemoryManager().summarize_memory()
+      pt = sm.queue_task(state['stmMemory'], state['history'], thread_id=state['thread_id'])
+      mm = MemoryManager()
+      memories = mm.summarize_memory(thread_id=state['thread_id'])
       print(memories)
       pt.result = memories
+      pt.version = mm.version(state['thread_id'])
       state['stmMemory'] = pt
       return state
 
+   @staticmethod
+   def needs_stm(state: ChatbotState) -> bool:
+      """False when no human message arrived since the checkpoint and the rendered STM is still current."""
+      pt = state['stmMemory']
+      if pt.result is None or pt.version != MemoryManager().version(state['thread_id']):
+         return True
+      return any(message.type == "human" for message in state['history'][pt.historyCheckpoint:])
+
+   @staticmethod
+   async def aretrieve_stm(state: ChatbotState) -> ChatbotState:
+      # queue_task talks to the Manager process, keep that off the event loop
+      return await asyncio.to_thread(StmNode.retrieve_stm, state)
+
+
+def benchmark_appends(url: str = "redis://localhost:6379/0", threads: int = 8, messages: int = 200) -> dict:
+   """Per-message EVALSHA vs one batch script per thread vs one pipeline for all threads, against a local Redis."""
+   from src.util.bench import best_of
+
+   storage = RedisSTMStorage(url=url, prefix="stm-bench:", max_messages=messages)
+   batches = {f"bench-{t}": [{"role": "user", "content": f"message {i} of thread {t}"} for i in range(messages)] for t in range(threads)}
+
+   def reset():
+      for tid in batches:
+         storage.clear_all(tid)
+
+   def sequential():
+      reset()
+      for tid, msgs in batches.items():
+         storage._append_sequential(tid, msgs)
+
+   def batched():
+      reset()
+      for tid, msgs in batches.items():
+         storage.append_messages_idempotent(tid, msgs)
+
+   def pipelined():
+      reset()
+      storage.append_messages_pipelined(batches)
+
+   report = {"threads": threads, "messages_per_thread": messages,
+             "sequential_s": best_of(sequential), "batched_s": best_of(batched), "pipelined_s": best_of(pipelined)}
+   reset()
+   print(report)
+   return report
+
 
 if __name__ == "__main__":
-   red = RedisSTMStorage()
+   red = create_stm_storage()
    message = HumanMessage(content="How are you?")
    usertext = " ".join(message.content for message in [message] if message.type == "human")
    red.merge_slots('thread-42', parse_session_slots(usertext))
    # red.append_messages_idempotent('thread-42', [message])
    #
-   hist = red.load_messages('thread-42')
+   hist = red.load_recent('thread-42', k=16)
    print(hist)
    sl = red.get_slots("thread-42")
    print(sl)
+   benchmark_appends()
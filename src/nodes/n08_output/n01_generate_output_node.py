@@ -1,9 +1,40 @@
+import asyncio
+import time
 from uuid import uuid4
 
 from langchain_core.messages import AIMessage
 
-from src.chatbot_state import ChatbotState
+from src.chatbot_state import ChatbotState, GenerationStats
+from src.context_manager import ContextManager, count_tokens
+from src.memory_manager import MemoryManager
 from src.model_manager import ModelManager
+from src.subprocess_manager import SubprocessManager
+
+
+class StreamTimer:
+   """Collects streamed tokens and measures time-to-first-token and throughput of one turn."""
+
+   def __init__(self):
+      self.tokens: list[str] = []
+      self.started = time.perf_counter()
+      self.first_token: float | None = None
+
+   def add(self, token: str):
+      if self.first_token is None:
+         self.first_token = time.perf_counter()
+      self.tokens.append(token)
+
+   def text(self) -> str:
+      return "".join(self.tokens)
+
+   def stats(self) -> GenerationStats:
+      ended = time.perf_counter()
+      first = self.first_token if self.first_token is not None else ended
+      streaming = ended - first
+      return GenerationStats(tokens=len(self.tokens),
+                             time_to_first_token=first - self.started,
+                             duration=ended - self.started,
+                             tokens_per_sec=len(self.tokens) / streaming if streaming > 0 else 0.0)
 
 
 class GenerateOutputNode:
@@ -11,23 +42,80 @@ class GenerateOutputNode:
    @staticmethod
    def generate_output(state: ChatbotState) -> ChatbotState:
       mm = ModelManager()
-      response = mm.invoke(model_name='lexi',
-                           persona=state['persona'],
-                           template_name='base_template',
-                           input_str=f"{state['user_input'].source.value}: {state['user_input'].content}",
-                           history=state['history'],
-                           stm_memory=state['stmMemory'].result)
-      state['output_message'] = AIMessage(content=response)
-      print(response)
+      input_str, history, summary = GenerateOutputNode._context(state, mm)
+      GenerateOutputNode._fold_evicted(state)
+      timer, emit = StreamTimer(), GenerateOutputNode._sink(state)
+      for token in mm.invoke_stream(model_name='lexi',
+                                    persona=state['persona'],
+                                    template_name='base_template',
+                                    input_str=input_str,
+                                    history=history,
+                                    stm_memory=state['stmMemory'].result,
+                                    session_summary=summary):
+         timer.add(token)
+         emit(token)
+      if state.get('output_sink') is None:
+         print()
+      return GenerateOutputNode._finish(state, timer)
+
+   @staticmethod
+   def _sink(state: ChatbotState):
+      """Where the streamed tokens go: the state's output_sink (one per session), else stdout."""
+      return state.get('output_sink') or (lambda token: print(token, end='', flush=True))
+
+   @staticmethod
+   def _context(state: ChatbotState, mm: ModelManager):
+      """Input string, the newest history that fits the token budget and the session summary; records ContextStats on the state."""
+      input_str = f"{state['user_input'].source.value}: {state['user_input'].content}"
+      summary = MemoryManager().session_summary(state['thread_id'])
+      system = mm.format_prompt(mm.templates.get((state['persona'], 'base_template'), ""), state['stmMemory'].result, summary)
+      history, stats = ContextManager().fit(state['thread_id'], state['history'], system, input_str)
+      state['contextStats'] = stats
+      print(f"context: {stats.tokens_in} tokens in, dropped {stats.dropped_messages} messages ({stats.dropped_tokens} tokens), "
+            f"{stats.utilisation:.0%} of {stats.budget} history budget")
+      return input_str, history, summary
+
+   @staticmethod
+   def _fold_evicted(state: ChatbotState):
+      """Turns that fell out of the window since the last summary go to the background summarizer."""
+      dropped = state['contextStats'].dropped_messages
+      if dropped > MemoryManager().summarized_upto(state['thread_id']):
+         SubprocessManager().queue_summary(state['history'][:dropped], thread_id=state['thread_id'])
+
+   @staticmethod
+   def _finish(state: ChatbotState, timer: StreamTimer) -> ChatbotState:
+      stats = timer.stats()
+      state['output_message'] = AIMessage(content=timer.text())
+      state['generationStats'] = stats
+      print(f"ttft={stats.time_to_first_token:.2f}s, {stats.tokens_per_sec:.1f} tok/s")
       return state
 
+   @staticmethod
+   async def agenerate_output(state: ChatbotState) -> ChatbotState:
+      mm = ModelManager()
+      input_str, history, summary = GenerateOutputNode._context(state, mm)
+      await asyncio.to_thread(GenerateOutputNode._fold_evicted, state)
+      timer, emit = StreamTimer(), GenerateOutputNode._sink(state)
+      async for token in mm.astream(model_name='lexi',
+                                    persona=state['persona'],
+                                    template_name='base_template',
+                                    input_str=input_str,
+                                    history=history,
+                                    stm_memory=state['stmMemory'].result,
+                                    session_summary=summary):
+         timer.add(token)
+         emit(token)
+      if state.get('output_sink') is None:
+         print()
+      return GenerateOutputNode._finish(state, timer)
+
    @staticmethod
    def get_recent_window(history, k=16):
       return history[-k:]
 
    @staticmethod
    def get_token_count(message: str):
-      return int(len(message) / 3)
+      return count_tokens(message)
 
    @staticmethod
    def update_salient(turn_id, extracts):
@@ -14,3 +14,7 @@ class UpdateHistoryNode:
 
       print(f'History: {len(state["history"])}')
       return state
+
+   @staticmethod
+   async def aupdate_history(state: ChatbotState) -> ChatbotState:
+      return UpdateHistoryNode.update_history(state)
@@ -1,13 +1,17 @@
 import json
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import re
+from functools import lru_cache
 from math import exp
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+from src.analysis_manager import AnalysisManager
+
 CRITICAL_PREDICATES = {
    "goal", "deadline", "due_date", "decision", "project", "task",
    "repo", "environment", "api_key", "customer", "priority",
@@ -15,6 +19,15 @@ CRITICAL_PREDICATES = {
 }
 
 
+# predicates that hold one value at a time: a second value is a contradiction, not another item
+# (likes, dislikes, fact, mood and the like are multi-valued and never conflict)
+SINGLE_VALUED_PREDICATES = {
+   "goal", "deadline", "due_date", "decision", "project", "task",
+   "repo", "environment", "api_key", "customer", "priority",
+   "persona", "email", "phone", "timezone", "name", "age", "location"
+}
+
+
 def make_slot_boosts(intent: dict | None) -> set[str]:
    if not intent:
       return set()
@@ -33,6 +46,7 @@ def parcel_key(p: dict) -> tuple[str, str, str]:
    )
 
 
+@lru_cache(maxsize=4096)
 def parse_iso(ts: str | None) -> datetime | None:
    if not ts:
       return None
@@ -43,32 +57,76 @@ def parse_iso(ts: str | None) -> datetime | None:
       return None
 
 
-def dedupe_parcels(parcels: list[dict]) -> list[dict]:
-   """Merge identical parcels (same subj/pred/value). Keep max confidence/stability, sum support, latest last_seen."""
-   merged: dict[tuple, dict] = {}
-   for p in parcels:
+class ParcelIndex:
+   """
+   Persistent merge index over STM parcels:
+     - Primary index: parcel_key (subject, predicate, canonical value) -> merged parcel.
+     - Secondary index: (subject, predicate) -> keys of the values seen for that slot.
+     - A single-valued slot (see SINGLE_VALUED_PREDICATES) holding more than one value is a conflict;
+       conflicts are tracked on insert, never by scanning.
+   """
+
+   def __init__(self, parcels: list[dict] | None = None, single_valued: set[str] = SINGLE_VALUED_PREDICATES):
+      self.single_valued = single_valued
+      self.by_key: dict[tuple, dict] = {}
+      self.rows: dict[tuple, int] = {}
+      self.columns = SalienceColumns()
+      self.by_slot: dict[tuple[str, str], dict[tuple, None]] = {}
+      self.conflicts: set[tuple[str, str]] = set()
+      for p in parcels or []:
+         self.add(p)
+
+   def add(self, p: dict) -> dict:
+      """Insert or merge one parcel. Keep max confidence/stability, sum support, latest last_seen."""
       k = parcel_key(p)
-      if k not in merged:
+      m = self.by_key.get(k)
+      if m is None:
          # normalize last_seen
          ls = p.get("source", {}).get("timestamp")
-         merged[k] = {
+         m = self.by_key[k] = {
             **p,
             "support": max(1, int(p.get("support", 1))),
             "_last_seen_dt": parse_iso(ls),
             "last_seen": ls,
          }
-      else:
-         m = merged[k]
-         m["support"] = m.get("support", 1) + max(1, int(p.get("support", 1)))
-         m["confidence"] = max(float(m.get("confidence", 0)), float(p.get("confidence", 0)))
-         m["stability"] = max(float(m.get("stability", 0)), float(p.get("stability", 0)))
-         # latest last_seen
-         ts = p.get("source", {}).get("timestamp")
-         dt = parse_iso(ts)
-         if dt and (m["_last_seen_dt"] is None or dt > m["_last_seen_dt"]):
-            m["_last_seen_dt"] = dt
-            m["last_seen"] = ts
-   return list(merged.values())
+         self.rows[k] = self.columns.add(m)
+         slot = self.by_slot.setdefault(k[:2], {})
+         slot[k] = None
+         if len(slot) > 1 and k[1] in self.single_valued:
+            self.conflicts.add(k[:2])
+         return m
+      m["support"] = m.get("support", 1) + max(1, int(p.get("support", 1)))
+      m["confidence"] = max(float(m.get("confidence", 0)), float(p.get("confidence", 0)))
+      m["stability"] = max(float(m.get("stability", 0)), float(p.get("stability", 0)))
+      # latest last_seen
+      ts = p.get("source", {}).get("timestamp")
+      dt = parse_iso(ts)
+      if dt and (m["_last_seen_dt"] is None or dt > m["_last_seen_dt"]):
+         m["_last_seen_dt"] = dt
+         m["last_seen"] = ts
+      self.columns.update(self.rows[k], m)
+      return m
+
+   def parcels(self) -> list[dict]:
+      return list(self.by_key.values())
+
+   def values_for(self, subject: str, predicate: str) -> list[dict]:
+      return [self.by_key[k] for k in self.by_slot.get((subject.lower(), predicate.lower()), {})]
+
+   def has_conflict(self, subject: str, predicate: str) -> bool:
+      return (subject.lower(), predicate.lower()) in self.conflicts
+
+   @property
+   def memory_conflict(self) -> bool:
+      return bool(self.conflicts)
+
+   def __len__(self):
+      return len(self.by_key)
+
+
+def dedupe_parcels(parcels: list[dict]) -> list[dict]:
+   """Merge identical parcels (same subj/pred/value). Keep max confidence/stability, sum support, latest last_seen."""
+   return ParcelIndex(parcels).parcels()
 
 
 def compute_salience(
@@ -126,24 +184,135 @@ def map_last_seen_turn(p: dict, ts2turn: dict[str, int]) -> int | None:
    return ts2turn.get(ts) if ts else None
 
 
-def select_salient_from_stm(
-      *,
-      history: list[dict],
-      parcels: list[dict],  # STM parcels
-      k: int = 10,
-      now: datetime | None = None,
-      intent: dict | None = None
-) -> list[dict]:
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US_PER_DAY = 86_400_000_000
+_NO_TIMESTAMP = np.iinfo(np.int64).min
+
+
+def _epoch_us(dt: datetime) -> int:
+   return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _exp_table(values: np.ndarray, scale: float) -> np.ndarray:
+   """exp(-v / scale) for integer v; evaluated once per distinct value with math.exp so scores match compute_salience bit for bit."""
+   uniq, inverse = np.unique(values, return_inverse=True)
+   return np.array([exp(-v / scale) for v in uniq.tolist()], dtype=np.float64)[inverse]
+
+
+class SalienceColumns:
    """
-   Return compact salient facts for the prompt:
-   [{"key":"user:deadline","value":"2025-10-01","confidence":0.86,"last_seen":"..."}]
+   Columnar store of salience features (support, confidence, stability, predicate, slot, last_seen),
+   kept in step with a ParcelIndex so a ranking never has to walk the parcel dicts again.
+   Rows are appended/updated in Python lists; the NumPy arrays are rebuilt lazily after a change.
    """
-   window = get_recent_window(history, k=8)  # your existing helper
-   recent_turns = {m.get("turn", i) for i, m in enumerate(window)}
-   ts2turn = index_ts_to_turn(history)
-   slot_boosts = make_slot_boosts(intent)
 
-   merged = dedupe_parcels(parcels)
+   def __init__(self):
+      self.parcels: list[dict] = []
+      self._rows: list[tuple] = []
+      self._predicates: dict[str, int] = {}
+      self._slots: dict[str, int] = {}
+      self._seen: dict[str, int] = {}
+      self._arrays: dict[str, np.ndarray] | None = None
+
+   def __len__(self):
+      return len(self.parcels)
+
+   def _row(self, p: dict) -> tuple:
+      pred = str(p.get("predicate", "")).lower()
+      slot = f"{str(p.get('subject', 'user')).lower()}:{pred}"
+      seen = p.get("last_seen") or p.get("source", {}).get("timestamp")
+      dt = p.get("_last_seen_dt") or parse_iso(p.get("last_seen"))
+      return (
+         min(max(1, int(p.get("support", 1))), 5) / 5.0,
+         float(p.get("confidence", 0.5)),
+         float(p.get("stability", 0.5)),
+         self._predicates.setdefault(pred, len(self._predicates)),
+         self._slots.setdefault(slot, len(self._slots)),
+         self._seen.setdefault(seen, len(self._seen)) if seen else -1,
+         _epoch_us(dt) if dt else _NO_TIMESTAMP,
+      )
+
+   def add(self, p: dict) -> int:
+      self.parcels.append(p)
+      self._rows.append(self._row(p))
+      self._arrays = None
+      return len(self.parcels) - 1
+
+   def update(self, row: int, p: dict):
+      self._rows[row] = self._row(p)
+      self._arrays = None
+
+   def arrays(self) -> dict[str, np.ndarray]:
+      if self._arrays is None:
+         cols = list(zip(*self._rows)) or [()] * 7
+         self._arrays = {
+            "support": np.array(cols[0], dtype=np.float64),
+            "confidence": np.array(cols[1], dtype=np.float64),
+            "stability": np.array(cols[2], dtype=np.float64),
+            "predicate": np.array(cols[3], dtype=np.int64),
+            "slot": np.array(cols[4], dtype=np.int64),
+            "seen": np.array(cols[5], dtype=np.int64),
+            "last_seen_us": np.array(cols[6], dtype=np.int64),
+         }
+         self._arrays["critical"] = self._per_predicate(lambda pred: pred in CRITICAL_PREDICATES)
+      return self._arrays
+
+   def _per_predicate(self, test) -> np.ndarray:
+      table = np.array([1.0 if test(pred) else 0.0 for pred in self._predicates] + [0.0], dtype=np.float64)
+      return table[self._arrays["predicate"]]
+
+   def score(self, *, ts2turn: dict[str, int], now: datetime | None, recent_turns: set[int], slot_boosts: set[str]) -> np.ndarray:
+      """compute_salience for every row in one vectorized pass."""
+      a = self.arrays()
+      n = len(self)
+      if not n:
+         return np.zeros(0)
+      now = now or datetime.now(timezone.utc)
+      needs_slot = self._per_predicate(lambda pred: pred in slot_boosts)
+
+      # recency by time ...
+      has_ts = a["last_seen_us"] != _NO_TIMESTAMP
+      days = np.where(has_ts, (_epoch_us(now) - np.where(has_ts, a["last_seen_us"], 0)) // _US_PER_DAY, 999)
+      recency = _exp_table(days, 14.0)
+      in_recent = np.zeros(n)
+      # ... unless the parcel maps onto a turn; resolved per distinct timestamp, not per parcel
+      if recent_turns:
+         turn_of_seen = [ts2turn.get(ts) for ts in self._seen]
+         known = np.array([t is not None for t in turn_of_seen] + [False])[a["seen"]]
+         turn = np.array([t if t is not None else 0 for t in turn_of_seen] + [0], dtype=np.int64)[a["seen"]]
+         dist = np.maximum(0, max(recent_turns) - turn)
+         recency = np.where(known, _exp_table(dist, 6.0), recency)
+         in_recent = np.where(known & np.isin(turn, list(recent_turns)), 1.0, 0.0)
+
+      return (
+            0.32 * recency +
+            0.23 * a["support"] +
+            0.23 * a["confidence"] +
+            0.10 * a["stability"] +
+            0.08 * a["critical"] +
+            0.04 * needs_slot +
+            0.04 * in_recent
+      )
+
+   def top_k(self, scores: np.ndarray, k: int) -> list[int]:
+      """Best row per slot, then the k best slots; ties resolve exactly like the stable sort in the scalar path."""
+      if not len(self) or k <= 0:
+         return []
+      slot = self.arrays()["slot"]
+      order = np.lexsort((np.arange(len(self)), -scores, slot))
+      first = np.ones(len(order), dtype=bool)
+      first[1:] = slot[order][1:] != slot[order][:-1]
+      best = order[first]
+      if len(best) > k:
+         # partial selection; keep everything tied with the k-th score so the final order stays exact
+         threshold = np.partition(scores[best], len(best) - k)[len(best) - k]
+         best = best[scores[best] >= threshold]
+      ranked = best[np.lexsort((slot[best], -scores[best]))]
+      return ranked[:k].tolist()
+
+
+def _rank_scalar(merged: list[dict], *, ts2turn: dict[str, int], now: datetime | None, recent_turns: set[int],
+                 slot_boosts: set[str], k: int) -> list[dict]:
    scored: list[tuple[float, dict]] = []
    for p in merged:
       t = map_last_seen_turn(p, ts2turn)
@@ -157,14 +326,90 @@ def select_salient_from_stm(
       if slot not in best_per_slot or s > best_per_slot[slot][0]:
          best_per_slot[slot] = (s, p)
 
-   top = sorted(best_per_slot.values(), key=lambda x: x[0], reverse=True)[:k]
+   return [p for _, p in sorted(best_per_slot.values(), key=lambda x: x[0], reverse=True)[:k]]
+
+
+def _rank_vectorized(columns: SalienceColumns, *, ts2turn: dict[str, int], now: datetime | None, recent_turns: set[int],
+                     slot_boosts: set[str], k: int) -> list[dict]:
+   scores = columns.score(ts2turn=ts2turn, now=now, recent_turns=recent_turns, slot_boosts=slot_boosts)
+   return [columns.parcels[i] for i in columns.top_k(scores, k)]
+
+
+def select_salient_from_stm(
+      *,
+      history: list[dict],
+      parcels: list[dict] | None = None,  # STM parcels
+      k: int = 10,
+      now: datetime | None = None,
+      intent: dict | None = None,
+      index: ParcelIndex | None = None,
+      vectorized: bool = True
+) -> list[dict]:
+   """
+   Return compact salient facts for the prompt:
+   [{"key":"user:deadline","value":"2025-10-01","confidence":0.86,"last_seen":"..."}]
+   Pass the thread's maintained ParcelIndex (MemoryManager.parcel_index) to skip re-merging the raw parcels;
+   otherwise they are merged once here and ranked from that index's columns.
+   """
+   window = get_recent_window(history, k=8)  # your existing helper
+   recent_turns = {m.get("turn", i) for i, m in enumerate(window)}
+   ts2turn = index_ts_to_turn(history)
+   slot_boosts = make_slot_boosts(intent)
+
+   index = index if index is not None else ParcelIndex(parcels or [])
+   kwargs = dict(ts2turn=ts2turn, now=now, recent_turns=recent_turns, slot_boosts=slot_boosts, k=k)
+   if vectorized:
+      top = _rank_vectorized(index.columns, **kwargs)
+   else:
+      top = _rank_scalar(index.parcels(), **kwargs)
 
    return [{
       "key": f"{(p.get('subject') or 'user').lower()}:{str(p.get('predicate')).lower()}",
       "value": p.get("value"),
       "confidence": float(p.get("confidence", 0.5)),
       "last_seen": p.get("last_seen"),
-   } for _, p in top]
+   } for p in top]
+
+
+def _synthetic_parcels(n: int, now: datetime, seed: int = 7) -> list[dict]:
+   """Raw STM parcels as extract_facts drafts them: turn or ISO timestamps, about half the values repeated."""
+   import random
+
+   rng = random.Random(seed)
+   predicates = sorted(CRITICAL_PREDICATES) + ["likes", "dislikes", "fact", "mood", "event", "condition"]
+   parcels = []
+   for _ in range(n):
+      ts = f"ts{rng.randrange(200)}" if rng.random() < 0.5 else (now - timedelta(days=rng.randrange(60))).isoformat()
+      parcels.append({"subject": "user", "predicate": rng.choice(predicates), "value": f"v{rng.randrange(max(1, n // 2))}",
+                      "support": rng.randint(1, 6), "confidence": rng.random(), "stability": rng.random(),
+                      "source": {"timestamp": ts}})
+   return parcels
+
+
+def benchmark_salience(sizes=(1_000, 10_000, 100_000), k: int = 10) -> list[dict]:
+   """
+   select_salient_from_stm, scalar vs vectorized, on the path callers use (raw parcels=, merged per call),
+   and ranking alone from a maintained per-thread ParcelIndex (index=).
+   """
+   from src.util.bench import best_of
+
+   now = datetime.now(timezone.utc)
+   history = [{"role": "user", "content": f"m{i}", "timestamp": f"ts{i}"} for i in range(200)]
+   intent = {"missing_slots": ["deadline"]}
+   report = []
+   for n in sizes:
+      parcels = _synthetic_parcels(n, now)
+      index = ParcelIndex(parcels)
+      select = lambda **kwargs: select_salient_from_stm(history=history, k=k, now=now, intent=intent, **kwargs)
+      scalar = best_of(lambda: select(parcels=parcels, vectorized=False))
+      vectorized = best_of(lambda: select(parcels=parcels))
+      indexed_scalar = best_of(lambda: select(index=index, vectorized=False))
+      indexed = best_of(lambda: select(index=index))
+      report.append({"parcels": n, "scalar_s": scalar, "vectorized_s": vectorized, "speedup": scalar / vectorized,
+                     "index_scalar_s": indexed_scalar, "index_vectorized_s": indexed,
+                     "index_speedup": indexed_scalar / indexed})
+      print(report[-1])
+   return report
 
 
 REQ_PATTERNS = re.compile(
@@ -200,9 +445,18 @@ def _channel(msg: dict[str, Any]) -> str:
    return (msg.get("metadata") or {}).get("channel") or "text"
 
 
+def _analysis(msg: dict[str, Any], key: str) -> dict:
+   """meaning/intent attached to the message, else the AnalysisManager's cached one; never recomputed here."""
+   found = (msg.get("metadata") or {}).get(key)
+   if found is None:
+      cached = AnalysisManager().lookup(msg)
+      found = getattr(cached, key, None)
+   return found or {}
+
+
 def _title_from(msg: dict[str, Any]) -> str:
    # Prefer first sentence from meaning; else first line; clip
-   meaning = (msg.get("metadata") or {}).get("meaning") or {}
+   meaning = _analysis(msg, "meaning")
    sents = meaning.get("sentences") or []
    base = (sents[0] if sents else (msg.get("content") or "")).strip()
    base = base.split("\n")[0].strip()
@@ -210,82 +464,90 @@ def _title_from(msg: dict[str, Any]) -> str:
 
 
 def _intent_is_request(msg: dict[str, Any]) -> bool:
-   intent = (msg.get("metadata") or {}).get("intent") or {}
+   intent = _analysis(msg, "intent")
    label = (intent.get("intent") or "").lower()
    # treat action/info/clarification as “threads”
    return label in {"action", "info", "clarification"}
 
 
 def _missing_slots(msg: dict[str, Any]) -> list[str]:
-   intent = (msg.get("metadata") or {}).get("intent") or {}
+   intent = _analysis(msg, "intent")
    return intent.get("missing_slots") or []
 
 
-def extract_open_threads(history: list[dict[str, Any]], *, stale_after_turns: int = 12) -> list[dict[str, Any]]:
+class ThreadTracker:
    """
-   Returns open threads with rich metadata:
-   [{"id","turn","title","status","since_turns","timestamp","channel","missing_slots"}]
+   Incremental open-thread tracking: consume() one message at a time instead of rescanning the history.
+   A closing message (assistant resolution, user ack/cancel) closes every thread opened before it,
+   which is exactly what the forward walk in the full scan does, so only open threads are kept.
    """
-   # Build a simple list we can scan
-   msgs = [(i, m) for i, m in enumerate(history)]
 
-   # 1) Find candidate user requests
-   candidates = []
-   for i, m in msgs:
+   def __init__(self, stale_after_turns: int = 12):
+      self.stale_after_turns = stale_after_turns
+      self.turns = 0
+      self.open: list[dict[str, Any]] = []
+
+   def consume(self, m: dict[str, Any]) -> None:
+      i = self.turns
+      self.turns += 1
+
+      # closures first: a message only closes threads opened before it
+      if self.open:
+         if _is_assistant(m) and RESOLVE_PATTERNS.search(m.get("content") or ""):
+            self.open = []
+         elif _is_user_interactive(m):
+            txt = m.get("content") or ""
+            if ACK_PATTERNS.search(txt) or CANCEL_PATTERNS.search(txt):
+               self.open = []
+
       if not _is_user_interactive(m):
-         continue
+         return
       text = m.get("content") or ""
       is_req = bool(REQ_PATTERNS.search(text)) or _intent_is_request(m)
       if not is_req:
-         continue
-      title = _title_from(m)
-      candidates.append({
+         return
+      self.open.append({
          "id": f"thr-{i}",
          "turn": i,
-         "title": title,
+         "title": _title_from(m),
          "status": "open",
          "timestamp": _ts(m) or None,
          "channel": _channel(m),
          "missing_slots": _missing_slots(m) or [],
       })
 
-   # 2) Walk forward to mark closures
-   for c in candidates:
-      opened_at = c["turn"]
-      for j, m in msgs[opened_at + 1:]:
-         # Assistant resolves explicitly
-         if _is_assistant(m) and RESOLVE_PATTERNS.search(m.get("content") or ""):
-            c["status"] = "closed"
-            c["resolved_turn"] = j
-            c["resolved_by"] = "assistant"
-            break
-         # User acknowledges or cancels
-         if _is_user_interactive(m):
-            txt = m.get("content") or ""
-            if ACK_PATTERNS.search(txt):
-               c["status"] = "closed"
-               c["resolved_turn"] = j
-               c["resolved_by"] = "user_ack"
-               break
-            if CANCEL_PATTERNS.search(txt):
-               c["status"] = "closed"
-               c["resolved_turn"] = j
-               c["resolved_by"] = "user_cancel"
-               break
-
-   # 3) Only open; compute age
-   open_threads = []
-   last_turn = len(history) - 1
-   now = datetime.now(timezone.utc).isoformat()
-   for c in candidates:
-      if c["status"] == "open":
+   def consume_many(self, messages: list[dict[str, Any]]) -> "ThreadTracker":
+      for m in messages:
+         self.consume(m)
+      return self
+
+   def open_threads(self, stale_after_turns: int | None = None) -> list[dict[str, Any]]:
+      stale_after_turns = self.stale_after_turns if stale_after_turns is None else stale_after_turns
+      last_turn = self.turns - 1
+      open_threads = []
+      for c in self.open:
          age = max(0, last_turn - c["turn"])
-         c["since_turns"] = age
-         c["stale"] = age >= stale_after_turns
-         c.setdefault("timestamp", now)
-         open_threads.append(c)
+         open_threads.append({**c, "missing_slots": list(c["missing_slots"]), "since_turns": age, "stale": age >= stale_after_turns})
+      return open_threads
+
+   def to_dict(self) -> dict[str, Any]:
+      return {"turns": self.turns, "stale_after_turns": self.stale_after_turns, "open": [dict(c) for c in self.open]}
 
-   return open_threads
+   @classmethod
+   def from_dict(cls, data: dict[str, Any]) -> "ThreadTracker":
+      tracker = cls(stale_after_turns=data.get("stale_after_turns", 12))
+      tracker.turns = data.get("turns", 0)
+      tracker.open = [dict(c) for c in data.get("open", [])]
+      return tracker
+
+
+def extract_open_threads(history: list[dict[str, Any]], *, stale_after_turns: int = 12) -> list[dict[str, Any]]:
+   """
+   Returns open threads with rich metadata:
+   [{"id","turn","title","status","since_turns","timestamp","channel","missing_slots"}]
+   One-shot wrapper around ThreadTracker; keep a tracker per session to avoid rescanning.
+   """
+   return ThreadTracker(stale_after_turns).consume_many(history).open_threads()
 
 
 def bullet(items):
@@ -375,13 +637,18 @@ def build_system_message(
       open_threads_bullets: str | None = None,
       meaning_json: dict | None = None,
       intent_json: dict | None = None,
+      message: dict | None = None,
       candidate_slot_fills: dict | None = None,
       now_iso: str | None = None,
       cap_summary: int = 1600,
       cap_meaning: int = 1600,
       cap_salient_items: int = 10,
 ) -> SystemMessage:
-   """Returns a SystemMessage with only the relevant audience instructions injected."""
+   """
+   Returns a SystemMessage with only the relevant audience instructions injected.
+   With `message` (the current user turn), missing meaning/intent are attached to it by the AnalysisManager,
+   so the thread tracker reuses them instead of analyzing the turn again.
+   """
 
    TEMPLATE_PATH = Path("personas/assistant/base_template.md")
    template = TEMPLATE_PATH.read_text('utf-8')
@@ -393,6 +660,10 @@ def build_system_message(
       compact = [{"k": x.get("key"), "v": x.get("value")} for x in salient_json[:cap_salient_items]]
       salient_val = json.dumps(compact, separators=(",", ":"))
    open_threads_val = open_threads_bullets or ""
+   if message is not None and not (meaning_json and intent_json):
+      metadata = AnalysisManager().attach([message])[0].get("metadata") or {}
+      meaning_json = meaning_json or metadata.get("meaning")
+      intent_json = intent_json or metadata.get("intent")
    meaning_val = _clamp_chars(json.dumps(meaning_json, ensure_ascii=False), cap_meaning) if meaning_json else ""
    intent_val = json.dumps(intent_json, ensure_ascii=False) if intent_json else ""
    slot_fills_val = json.dumps(candidate_slot_fills, separators=(",", ":")) if candidate_slot_fills else ""
@@ -480,3 +751,5 @@ if __name__ == "__main__":
    messages = [sysmsg, *history, mes]
    prompt = ChatPromptTemplate.from_messages(messages)
    print(prompt)
+
+   benchmark_salience()
@@ -0,0 +1,203 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+# everything through src.*, the way the nodes import it: one module, one singleton
+from src.analysis_manager import AnalysisManager
+from src.chatbot_state import ChatbotState, ProcessingTask, RawInput, InputSource
+from src.context_manager import ContextManager
+from src.memory_manager import MemoryManager
+from src.prompt_manager import ThreadTracker
+from src.util.cancellation_token import CancellationToken
+from src.workflow import Workflow
+
+
+class SessionManagerMeta(type):
+   _instances = {}
+
+   @classmethod
+   def __call__(mcs, *args, **kwargs):
+      if mcs not in mcs._instances:
+         instance = super().__call__(SessionManager, *args, **kwargs)
+         mcs._instances[mcs] = instance
+      return mcs._instances[mcs]
+
+
+@dataclass
+class Session:
+   thread_id: str
+   state: ChatbotState
+   inbox: deque = field(default_factory=deque)
+   scheduled: bool = False
+   turns: int = 0
+   latencies: list[float] = field(default_factory=list)
+   threads: ThreadTracker = field(default_factory=ThreadTracker)
+   # streamed reply tokens when the session has no sink of its own; concurrent sessions never share stdout
+   streamed: list[str] = field(default_factory=list)
+   errors: list[str] = field(default_factory=list)
+
+   def track_threads(self):
+      """Feed messages appended since the last call to the open-thread tracker."""
+      messages = []
+      for message in self.state['history'][self.threads.turns:]:
+         role = {"human": "user", "ai": "assistant"}.get(message.type, message.type)
+         # the metadata dict is the message's own, so attached meaning/intent stay on the history message
+         messages.append({"role": role, "content": message.content, "metadata": message.additional_kwargs.setdefault("metadata", {})})
+      AnalysisManager().attach([m for m in messages if m["role"] == "user"])
+      for m in messages:
+         self.threads.consume(m)
+
+   def snapshot(self) -> dict:
+      """Serializable session bookkeeping, read back by restore()."""
+      return {"thread_id": self.thread_id, "turns": self.turns, "threads": self.threads.to_dict()}
+
+   def restore(self, snapshot: dict):
+      """Resume from snapshot() instead of rescanning: track_threads() only feeds the messages after the snapshot."""
+      self.turns = snapshot.get("turns", 0)
+      self.threads = ThreadTracker.from_dict(snapshot.get("threads") or {})
+
+
+def new_state(thread_id: str, persona: str = "assistant", output_sink: Callable[[str], None] | None = None) -> ChatbotState:
+   return ChatbotState(
+      thread_id=thread_id,
+      persona=persona,
+      history=[],
+      user_input=None,
+      output_message=None,
+      stmMemory=ProcessingTask(name='stm', result=None, task=None, historyCheckpoint=0),
+      generationStats=None,
+      contextStats=None,
+      output_sink=output_sink
+   )
+
+
+class SessionManager(metaclass=SessionManagerMeta):
+   """
+   Serves many conversations from one process:
+     - One ChatbotState per thread id, sharing the model clients of ModelManager.
+     - STM and subprocess bookkeeping are keyed by thread id.
+     - Round-robin scheduling: a session holds at most one slot in the ready queue, so a chatty
+       session goes to the back of the line after every turn instead of starving the others.
+   """
+   sessions: dict[str, Session]
+   ready: asyncio.Queue
+   workflow: Workflow
+   started: float | None
+   completed: int
+   failed: int
+
+   def __init__(self):
+      self.sessions = {}
+      self.ready = asyncio.Queue()
+      self.workflow = Workflow(interactive=False)
+      self.started = None
+      self.completed = 0
+      self.failed = 0
+
+   def get_session(self, thread_id: str, persona: str = "assistant", sink: Callable[[str], None] | None = None) -> Session:
+      """The thread's session, created on first use; its streamed tokens go to `sink`, else to session.streamed."""
+      if thread_id not in self.sessions:
+         session = Session(thread_id=thread_id, state=new_state(thread_id, persona))
+         session.state['output_sink'] = sink or session.streamed.append
+         self.sessions[thread_id] = session
+      return self.sessions[thread_id]
+
+   def restore_session(self, snapshot: dict, history: list | None = None, persona: str = "assistant",
+                       sink: Callable[[str], None] | None = None) -> Session:
+      """A session reloaded from Session.snapshot() and its persisted history."""
+      session = self.get_session(snapshot["thread_id"], persona, sink)
+      if history is not None:
+         session.state['history'] = list(history)
+      session.restore(snapshot)
+      return session
+
+   def close_session(self, thread_id: str):
+      self.sessions.pop(thread_id, None)
+      MemoryManager().drop_stm(thread_id)
+      ContextManager().drop_thread(thread_id)
+
+   def submit(self, thread_id: str, content: str, source: InputSource = InputSource.TEXT):
+      session = self.get_session(thread_id)
+      session.inbox.append(RawInput(content=content, source=source))
+      if not session.scheduled:
+         session.scheduled = True
+         self.ready.put_nowait(thread_id)
+
+   async def serve(self, max_concurrency: int = 4, ct: CancellationToken | None = None):
+      """Run turns until cancelled; at most max_concurrency turns are in flight at once."""
+      ct = ct or CancellationToken()
+      self.started = self.started or time.perf_counter()
+      workers = [asyncio.create_task(self._worker(ct)) for _ in range(max_concurrency)]
+      try:
+         await asyncio.gather(*workers)
+      finally:
+         for w in workers:
+            w.cancel()
+
+   async def drain(self, max_concurrency: int = 4):
+      """Serve until every submitted input has been answered."""
+      ct = CancellationToken()
+      server = asyncio.create_task(self.serve(max_concurrency, ct))
+      await self.ready.join()
+      ct.cancel()
+      server.cancel()
+
+   async def _worker(self, ct: CancellationToken):
+      while not ct.is_canceled():
+         thread_id = await self.ready.get()
+         try:
+            session = self.sessions.get(thread_id)
+            if session is None or not session.inbox:
+               continue
+            await self._turn(session)
+         except Exception as e:
+            # reported with the session (errors, stats()["failed"]), the next turn still runs
+            session.errors.append(repr(e))
+            self.failed += 1
+         finally:
+            if session is not None and session.inbox:
+               self.ready.put_nowait(thread_id)
+            elif session is not None:
+               session.scheduled = False
+            self.ready.task_done()
+
+   async def _turn(self, session: Session):
+      started = time.perf_counter()
+      session.state['user_input'] = session.inbox.popleft()
+      session.state = await self.workflow.graph.ainvoke(session.state, {"recursion_limit": 100})
+      # meaning/intent analysis of the new user turn runs the models, keep it off the event loop
+      await asyncio.to_thread(session.track_threads)
+      session.turns += 1
+      session.latencies.append(time.perf_counter() - started)
+      self.completed += 1
+
+   def stats(self) -> dict:
+      latencies = sorted(lat for s in self.sessions.values() for lat in s.latencies)
+      elapsed = time.perf_counter() - self.started if self.started else 0.0
+      return {
+         "sessions": len(self.sessions),
+         "turns": self.completed,
+         "failed": self.failed,
+         "elapsed": elapsed,
+         "turns_per_sec": self.completed / elapsed if elapsed > 0 else 0.0,
+         "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+         "latency_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+      }
+
+
+if __name__ == '__main__':
+   from src.subprocess_manager import SubprocessManager
+
+   async def simulate(users: int = 24, turns: int = 3):
+      sessions = SessionManager()
+      for turn in range(turns):
+         for user in range(users):
+            sessions.submit(f"user-{user}", f"Hi, this is user {user}, message {turn}. How are you?")
+      await sessions.drain(max_concurrency=8)
+      print(sessions.stats())
+
+   sm = SubprocessManager()
+   asyncio.run(simulate())
+   sm.shutdown()
@@ -1,5 +1,7 @@
 import time
-from asyncio import Queue, QueueEmpty
+from collections import deque
+from dataclasses import dataclass
+from queue import Queue
 from concurrent.futures import ProcessPoolExecutor, Future
 from threading import Thread, Event
 from multiprocessing import Manager
@@ -7,6 +9,7 @@ from multiprocessing import Manager
 from src.chatbot_state import ProcessingTask
 from src.memory_manager import MemoryManager
 from src.subprocesses.extract_facts import extract_facts
+from src.subprocesses.summarize_rolling import summarize_rolling
 
 
 class SubprocessManagerMeta(type):
@@ -20,57 +23,150 @@ class SubprocessManagerMeta(type):
       return mcs._instances[mcs]
 
 
+@dataclass
+class TaskTiming:
+   name: str
+   thread_id: str
+   queue_wait: float
+   pool_wait: float
+   pool_run: float
+   failed: bool = False
+
+
+def _timed(fn, *args):
+   """Runs inside the pool worker, so the timestamps measure the job itself and not the pool's backlog."""
+   started = time.time()
+   result = fn(*args)
+   return result, started, time.time()
+
+
 class SubprocessManager(metaclass=SubprocessManagerMeta):
    queue: Queue
    thread: Thread
    stop: Event
    pool: ProcessPoolExecutor
    tasks: dict
+   timings: deque
 
    def __init__(self):
       self.queue = Queue()
       self.stop = Event()
       self.pool = ProcessPoolExecutor(max_workers=1)
       self.tasks = Manager().dict()
+      self.timings = deque(maxlen=100)
       self.thread = Thread(target=self._run, daemon=True, args=(self.tasks,))
       self.thread.start()
 
    def __del__(self):
+      self.shutdown()
+
+   def shutdown(self):
+      if self.stop.is_set():
+         return
       self.stop.set()
+      # wake the dispatcher, it is blocked on queue.get()
+      self.queue.put(None)
       if self.thread:
          self.thread.join(2)
       if self.pool:
          self.pool.shutdown(wait=True, cancel_futures=True)
 
-   def queue_task(self, pt: ProcessingTask, history: list):
-      if pt.name in self.tasks and self.tasks[pt.name].task is not None:
+   def queue_task(self, pt: ProcessingTask, history: list, thread_id: str = "default"):
+      key = f"{thread_id}:{pt.name}"
+      if key in self.tasks and self.tasks[key].task is not None:
+         return pt
+      messages = [message.content for message in history[pt.historyCheckpoint:] if message.type == "human"]
+      if not messages:
          return pt
-      self.queue.put_nowait({"name": pt.name, "messages": [message.content for message in history[pt.historyCheckpoint:] if message.type == "human"]})
+      self.submit({"name": pt.name, "thread_id": thread_id, "messages": messages})
       p = ProcessingTask(task='queued', result=None, name='stm', historyCheckpoint=len(history))
-      self.tasks[pt.name] = p
+      self.tasks[key] = p
       return p
 
+   def queue_summary(self, history: list, thread_id: str = "default"):
+      """Fold history[summarized_upto:len(history)] into the session summary in the background."""
+      key = f"{thread_id}:summary"
+      if key in self.tasks and self.tasks[key].task is not None:
+         return
+      mm = MemoryManager()
+      start = mm.summarized_upto(thread_id)
+      if len(history) <= start:
+         return
+      role = {"human": "user", "ai": "assistant"}
+      turns = [f"{role.get(message.type, message.type)}: {message.content}" for message in history[start:]]
+      self.submit({"name": "summary", "thread_id": thread_id, "previous": mm.session_summary(thread_id),
+                   "turns": turns, "upto": len(history)})
+      self.tasks[key] = ProcessingTask(task='queued', result=None, name='summary', historyCheckpoint=len(history))
+
+   def submit(self, task: dict):
+      self.queue.put({**task, "enqueued": time.time()})
+
    def _run(self, tasks):
       while not self.stop.is_set():
-         try:
-            task = self.queue.get_nowait()
-            if task['name'] == "stm":
-               fut = self.pool.submit(extract_facts, task['messages'])
-               fut.add_done_callback(lambda f: self._done(f, task['name'], tasks))
-         except QueueEmpty:
-            time.sleep(10)
-
-   @staticmethod
-   def _done(future: Future, name: str, tasks: dict):
-      result: list = future.result()
-      MemoryManager().store_stm(memories=result)
-      pt = tasks[name]
-      pt.task = None
-      tasks[name] = pt
+         task = self.queue.get()
+         if task is None:
+            break
+         if task['name'] == "stm":
+            job = (extract_facts, task['messages'])
+         elif task['name'] == "summary":
+            job = (summarize_rolling, task['previous'], task['turns'])
+         else:
+            continue
+         dispatched = time.time()
+         fut = self.pool.submit(_timed, *job)
+         fut.add_done_callback(lambda f, t=task, d=dispatched: self._done(f, t, d, tasks))
+
+   def _record_timing(self, task: dict, dispatched: float, started: float | None, ended: float | None):
+      # a failed job has no worker timestamps: its whole time since dispatch counts as pool_wait
+      failed = started is None
+      now = time.time()
+      started, ended = (now, now) if failed else (started, ended)
+      timing = TaskTiming(name=task['name'], thread_id=task['thread_id'],
+                          queue_wait=dispatched - task['enqueued'],
+                          pool_wait=started - dispatched,
+                          pool_run=ended - started,
+                          failed=failed)
+      self.timings.append(timing)
+      print(f"{timing.name}[{timing.thread_id}] queue_wait={timing.queue_wait:.3f}s "
+            f"pool_wait={timing.pool_wait:.3f}s pool_run={timing.pool_run:.3f}s{' failed' if failed else ''}")
+
+   def _done(self, future: Future, task: dict, dispatched: float, tasks: dict):
+      started = ended = None
+      key = f"{task['thread_id']}:{task['name']}"
+      try:
+         result, started, ended = future.result()
+         if task['name'] == "stm":
+            MemoryManager().store_stm(memories=result, thread_id=task['thread_id'])
+         elif task['name'] == "summary":
+            MemoryManager().store_summary(summary=result, upto=task['upto'], thread_id=task['thread_id'])
+      except Exception as e:
+         # e.g. Ollama down: log it and move on, a rolling summary is retried from summarized_upto next turn
+         print(f"{task['name']}[{task['thread_id']}] failed: {e!r}")
+      finally:
+         self._record_timing(task, dispatched, started, ended)
+         # always release the slot, a job left marked as queued would block every later one for this thread
+         pt = tasks.get(key)
+         if pt is not None:
+            pt.task = None
+            tasks[key] = pt
+
+   def timing_stats(self) -> dict:
+      timings = list(self.timings)
+      if not timings:
+         return {"tasks": 0}
+      return {
+         "tasks": len(timings),
+         "queue_wait_mean": sum(t.queue_wait for t in timings) / len(timings),
+         "queue_wait_max": max(t.queue_wait for t in timings),
+         "pool_wait_mean": sum(t.pool_wait for t in timings) / len(timings),
+         "pool_run_mean": sum(t.pool_run for t in timings) / len(timings),
+         "failed": sum(t.failed for t in timings),
+      }
 
 
 if __name__ == '__main__':
    sm = SubprocessManager()
-   sm.queue.put_nowait({"name": "stm", "messages": []})
+   sm.submit({"name": "stm", "thread_id": "default", "messages": []})
    time.sleep(180)
-   del sm
+   print(sm.timing_stats())
+   sm.shutdown()
@@ -1,7 +1,13 @@
-from transformers import pipeline
+import numpy as np
+
+from src.subprocesses.model_registry import ModelRegistry
 
 HF_MODEL_ID = "Falconsai/intent_classification"
-_intent = pipeline("text-classification", model=HF_MODEL_ID, top_k=None)
+
+
+def _intent(text, **kwargs):
+   # loaded on first use and shared through the registry, importing this module stays cheap
+   return ModelRegistry().pipeline("text-classification", model=HF_MODEL_ID, top_k=None)(text, **kwargs)
 
 LABEL_MAP = {
    "information_request": "info",
@@ -53,3 +59,76 @@ def analyze_intent(text: str, meaning: dict) -> dict:
       "reason": reason,
       "slots": meaning.get("critical_slots", {})
    }
+
+
+def _empty_result() -> dict:
+   return {"intent": "other", "confidence": 0.0, "reason": "empty", "slots": {}}
+
+
+def analyze_intent_batch(texts: list[str], meanings: list[dict], batch_size: int = 32) -> list[dict]:
+   """
+   Same results as [analyze_intent(t, m) for t, m in zip(texts, meanings)], but the classifier runs over all
+   non-empty texts in batches of batch_size and the heuristic ensemble is evaluated as array operations.
+   """
+   stripped = [(t or "").strip() for t in texts]
+   idx = [i for i, t in enumerate(stripped) if t]
+   results = [_empty_result() for _ in texts]
+   if not idx:
+      return results
+
+   outputs = _intent([stripped[i] for i in idx], truncation=True, batch_size=batch_size)
+   tops = [max(out, key=lambda r: r["score"]) for out in outputs]
+   labels = np.array([top["label"] for top in tops], dtype=object)
+   conf = np.array([float(top["score"]) for top in tops])
+   mapped = np.array([LABEL_MAP.get(label, "other") for label in labels], dtype=object)
+
+   used = [meanings[i] for i in idx]
+   question = np.array([bool(m.get("questions")) for m in used])
+   command = np.array([bool(m.get("commands")) for m in used])
+   h_intent = np.where(question, "info", np.where(command, "action", "other")).astype(object)
+   h_conf = np.where(question | command, 0.7, 0.5)
+   h_reason = np.where(question, "heuristic:question", np.where(command, "heuristic:command", "heuristic:default")).astype(object)
+
+   strong = conf >= 0.80
+   agree = mapped == h_intent
+   intent = np.where(strong | agree, mapped, h_intent)
+   confidence = np.where(strong, conf,
+                         np.where(agree, np.minimum(1.0, (conf + h_conf) / 2 + 0.1), np.maximum(conf, h_conf - 0.05)))
+   reason = np.where(strong, "falcon:" + labels,
+                     np.where(agree, "falcon+" + h_reason, "heuristic_over_falcon:" + labels))
+
+   has_qm = np.array(["?" in stripped[i] for i in idx])
+   nudge = has_qm & ~np.isin(intent, ["info", "clarification"]) & (confidence < 0.8)
+   intent = np.where(nudge, "info", intent)
+   confidence = np.where(nudge, np.maximum(confidence, 0.7), confidence)
+   reason = np.where(nudge, reason + "+qm_nudge", reason)
+
+   for j, i in enumerate(idx):
+      results[i] = {
+         "intent": str(intent[j]),
+         "confidence": float(confidence[j]),
+         "reason": str(reason[j]),
+         "slots": used[j].get("critical_slots", {})
+      }
+   return results
+
+
+def benchmark_intent(n: int = 256, batch_size: int = 32) -> dict:
+   """Texts per second: analyze_intent one text at a time vs analyze_intent_batch."""
+   from src.util.bench import best_of
+
+   samples = ["Can you restart the staging server?", "Deploy the hotfix to prod now.", "I think the new UI looks great",
+              "What do you mean by warm cache?", "haha nice one", "Why did step 3 fail again?"]
+   texts = [samples[i % len(samples)] + f" #{i}" for i in range(n)]
+   meanings = [{"questions": [t] if "?" in t else [], "commands": []} for t in texts]
+   _intent("warm up")
+   single = best_of(lambda: [analyze_intent(t, m) for t, m in zip(texts, meanings)], repeat=1)
+   batched = best_of(lambda: analyze_intent_batch(texts, meanings, batch_size=batch_size), repeat=1)
+   report = {"texts": n, "batch_size": batch_size, "single_per_s": n / single, "batch_per_s": n / batched,
+             "speedup": single / batched}
+   print(report)
+   return report
+
+
+if __name__ == '__main__':
+   benchmark_intent()
@@ -1,8 +1,34 @@
 import re
 from datetime import datetime, timedelta
-import spacy
-
-nlp = spacy.load("en_core_web_sm")
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from src.util.text_matcher import TextMatcher
+
+SPACY_MODEL = "en_core_web_sm"
+# Components whose output identify_meaning reads; anything else a model ships is excluded at load time.
+REQUIRED_COMPONENTS = {
+   "tok2vec",  # shared features for tagger/parser
+   "tagger",  # POS, feeds attribute_ruler and the lemmatizer
+   "attribute_ruler",  # POS mapping the lemmatizer's rules depend on
+   "lemmatizer",  # keyphrases (tok.lemma_)
+   "parser",  # noun_chunks and sentences
+   "ner",  # entities
+}
+
+
+@lru_cache(maxsize=None)
+def _nlp():
+   """Loaded on first use, so importing this module stays cheap."""
+   import spacy
+   from spacy.util import get_model_meta, get_package_path
+   try:
+      meta = get_model_meta(get_package_path(SPACY_MODEL))
+      # "components" also lists the ones shipped disabled (e.g. senter), which we never need either
+      components = meta.get("components") or meta.get("pipeline", [])
+   except Exception:
+      components = []
+   return spacy.load(SPACY_MODEL, exclude=[c for c in components if c not in REQUIRED_COMPONENTS])
 
 # --- Heuristic helpers (from your MVP, trimmed) ---
 DATE_WORDS = {"today": 0, "tomorrow": 1, "day after tomorrow": 2, "eod": 0, "end of day": 0, "next week": 7}
@@ -11,28 +37,40 @@ URL_RE = re.compile(r"https?://\S+")
 EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
 NUM_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(days?|hrs?|hours?|percent|%)?\b", re.I)
 CMD_VERBS = r"\b(make|create|write|build|set|add|fix|debug|generate|summarize|explain|plan|design)\b"
+QUESTION_WORDS = r"\b(how|what|when|where|why|should)\b"
+
+# every heuristic pattern of this module, compiled once; the \b-anchored ones share a single pass per message
+MEANING_MATCHER = TextMatcher({
+   **{f"date:{word}": re.compile(rf"\b{re.escape(word)}\b", re.I) for word in DATE_WORDS},
+   **{f"weekday:{wd}": re.compile(rf"\b(next\s+{wd})\b", re.I) for wd in WEEKDAYS},
+   "number": NUM_RE,
+   "question": re.compile(QUESTION_WORDS, re.I),
+   "command": re.compile(CMD_VERBS, re.I),
+}, others={"url": URL_RE, "email": EMAIL_RE})
 
 
 def _rel_day_to_iso(offset: int, now: datetime) -> str:
    return (now + timedelta(days=offset)).date().isoformat()
 
 
-def _extract_relative_dates(text: str, now: datetime) -> list[dict]:
+def _extract_relative_dates(text: str, now: datetime, hits: dict | None = None) -> list[dict]:
+   hits = hits or MEANING_MATCHER.scan(text)
    ents = []
    for word, off in DATE_WORDS.items():
-      for m in re.finditer(rf"\b{re.escape(word)}\b", text, re.I):
+      for m in hits[f"date:{word}"]:
          ents.append({"type": "DATE", "text": m.group(0), "norm": _rel_day_to_iso(off, now)})
    for wd, idx in WEEKDAYS.items():
-      for m in re.finditer(rf"\b(next\s+{wd})\b", text, re.I):
+      for m in hits[f"weekday:{wd}"]:
          delta = (idx - now.weekday()) % 7
          delta = 7 if delta == 0 else delta
          ents.append({"type": "DATE", "text": m.group(0), "norm": _rel_day_to_iso(delta, now)})
    return ents
 
 
-def _extract_numbers(text: str) -> list[dict]:
+def _extract_numbers(text: str, hits: dict | None = None) -> list[dict]:
+   hits = hits or MEANING_MATCHER.scan(text, names=["number"])
    out = []
-   for m in NUM_RE.finditer(text):
+   for m in hits["number"]:
       val = float(m.group(1));
       unit = m.group(2).lower() if m.group(2) else None
       if unit == "percent": unit = "%"
@@ -40,22 +78,21 @@ def _extract_numbers(text: str) -> list[dict]:
    return out
 
 
-def _detect_questions(text: str) -> bool:
-   return "?" in text or bool(re.search(r"\b(how|what|when|where|why|should)\b", text, re.I))
+def _detect_questions(text: str, hits: dict | None = None) -> bool:
+   hits = hits or MEANING_MATCHER.scan(text, names=["question"])
+   return "?" in text or bool(hits["question"])
 
 
-def _detect_commands(text: str) -> bool:
-   return bool(re.search(CMD_VERBS, text, re.I)) or "please" in text.lower()
+def _detect_commands(text: str, hits: dict | None = None) -> bool:
+   hits = hits or MEANING_MATCHER.scan(text, names=["command"])
+   return bool(hits["command"]) or "please" in text.lower()
 
 
-def identify_meaning(text: str, *, now: datetime | None = None, token_count_fn=lambda s: len(s.split())) -> dict:
-   now = now or datetime.utcnow()
-   t = re.sub(r"\s+", " ", text or "").strip()
+def _normalize(text: str) -> str:
+   return re.sub(r"\s+", " ", text or "").strip()
 
-   doc = nlp(t)
 
-   # spaCy bits
-   ents_spacy = [{"type": e.label_, "text": e.text} for e in doc.ents]
+def _keyphrases(doc) -> list[str]:
    noun_chunks = []
    seen = set()
    for nc in doc.noun_chunks:
@@ -64,16 +101,26 @@ def identify_meaning(text: str, *, now: datetime | None = None, token_count_fn=l
          noun_chunks.append(kp);
          seen.add(kp)
       if len(noun_chunks) >= 10: break
+   return noun_chunks
+
+
+def _meaning_from_doc(doc, now: datetime, token_count_fn) -> dict:
+   t = doc.text
+
+   # spaCy bits
+   ents_spacy = [{"type": e.label_, "text": e.text} for e in doc.ents]
+   noun_chunks = _keyphrases(doc)
 
    # Heuristics augment/normalize
-   ents = ents_spacy + _extract_relative_dates(t, now)
+   hits = MEANING_MATCHER.scan(t)
+   ents = ents_spacy + _extract_relative_dates(t, now, hits)
    # ensure EMAIL/URL if spaCy missed them
-   ents += [{"type": "URL", "text": m.group(0)} for m in URL_RE.finditer(t)]
-   ents += [{"type": "EMAIL", "text": m.group(0)} for m in EMAIL_RE.finditer(t)]
+   ents += [{"type": "URL", "text": m.group(0)} for m in hits["url"]]
+   ents += [{"type": "EMAIL", "text": m.group(0)} for m in hits["email"]]
 
-   nums = _extract_numbers(t)
-   is_q = _detect_questions(t)
-   is_cmd = _detect_commands(t)
+   nums = _extract_numbers(t, hits)
+   is_q = _detect_questions(t, hits)
+   is_cmd = _detect_commands(t, hits)
 
    # Slots: first DATE/URL/EMAIL (you can add more later)
    def first(label):
@@ -98,3 +145,43 @@ def identify_meaning(text: str, *, now: datetime | None = None, token_count_fn=l
       "commands": is_cmd,
       "critical_slots": slots,
    }
+
+
+def identify_meaning(text: str, *, now: datetime | None = None, token_count_fn=lambda s: len(s.split())) -> dict:
+   now = now or datetime.utcnow()
+   return _meaning_from_doc(_nlp()(_normalize(text)), now, token_count_fn)
+
+
+def identify_meaning_many(texts: Iterable[str], *, now: datetime | None = None, batch_size: int = 64, n_process: int = 1,
+                          token_count_fn=lambda s: len(s.split())) -> Iterator[dict]:
+   """
+   Streaming identify_meaning over many texts, in input order. spaCy batches the texts (batch_size) and,
+   with n_process > 1, spreads the batches over worker processes; the regex heuristics run here as docs arrive.
+   """
+   now = now or datetime.utcnow()
+   for doc in _nlp().pipe((_normalize(t) for t in texts), batch_size=batch_size, n_process=n_process):
+      yield _meaning_from_doc(doc, now, token_count_fn)
+
+
+def benchmark_meaning(n: int = 2000, batch_size: int = 64, n_process: int = 2) -> dict:
+   """Messages per second: identify_meaning per message vs identify_meaning_many in one and several processes."""
+   from src.util.bench import best_of
+
+   samples = ["Can you fix the login bug by tomorrow? Details are at https://example.com/issue/42",
+              "Please summarize the meeting notes and email them to ana@example.com next friday.",
+              "The deploy took 3 hours and failed at 80% because the cache was cold.",
+              "I think we should plan the migration for next week, what do you think?"]
+   texts = [samples[i % len(samples)] for i in range(n)]
+   now = datetime.utcnow()
+   _nlp()
+   single = best_of(lambda: [identify_meaning(t, now=now) for t in texts], repeat=1)
+   piped = best_of(lambda: list(identify_meaning_many(texts, now=now, batch_size=batch_size)), repeat=1)
+   multi = best_of(lambda: list(identify_meaning_many(texts, now=now, batch_size=batch_size, n_process=n_process)), repeat=1)
+   report = {"messages": n, "single_per_s": n / single, "pipe_per_s": n / piped,
+             f"pipe_{n_process}proc_per_s": n / multi, "pipeline": _nlp().pipe_names}
+   print(report)
+   return report
+
+
+if __name__ == '__main__':
+   benchmark_meaning()
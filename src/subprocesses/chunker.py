@@ -0,0 +1,111 @@
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class Chunk:
+   text: str
+   tokens: int
+   start: int
+   end: int
+
+
+def pair_lines(lines: list[str]) -> list[str]:
+   """Group transcript lines two by two (user turn + reply); an odd last line stays on its own."""
+   return ["\n".join(lines[i:i + 2]) for i in range(0, len(lines), 2)]
+
+
+def token_counts(tokenizer, texts: list[str]) -> list[int]:
+   """One batched tokenizer call, each text tokenized exactly once, without special tokens."""
+   if not texts:
+      return []
+   return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']]
+
+
+def pack_chunks(units: list[str], counts: list[int], limit: int, overhead: int = 0, separator_tokens: int = 1) -> list[Chunk]:
+   """
+   Greedy packing by cumulative token count: units are joined with newlines while
+   overhead + sum(counts) + separators stays within limit. A unit over the limit gets a chunk of its own.
+   """
+   chunks = []
+   start, used = 0, overhead
+   for i, count in enumerate(counts):
+      extra = count + (separator_tokens if i > start else 0)
+      if i > start and used + extra > limit:
+         chunks.append(Chunk(text="\n".join(units[start:i]), tokens=used, start=start, end=i))
+         start, extra, used = i, count, overhead
+      used += extra
+   if start < len(units):
+      chunks.append(Chunk(text="\n".join(units[start:]), tokens=used, start=start, end=len(units)))
+   return chunks
+
+
+def chunk_transcript(history: str, tokenizer, limit: int) -> list[Chunk]:
+   units = pair_lines([line for line in history.split('\n') if line.strip()])
+   counts = token_counts(tokenizer, units)
+   overhead = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 0
+   separator = max(len(tokenizer("\n", add_special_tokens=False)['input_ids']), 1)
+   return pack_chunks(units, counts, limit, overhead, separator)
+
+
+def map_reduce(chunks: list[Chunk], summarize_many: Callable[[list[Chunk]], list[str]], tokenizer, limit: int,
+               reduce: bool = True) -> str:
+   """
+   Map: summarize_many gets every chunk at once, so it can batch them (HF pipeline batch_size) or fan them out.
+   Reduce: the chunk summaries are packed again and summarized until a single summary remains
+   (reduce=False returns the chunk summaries one per line instead).
+   """
+   while True:
+      summaries = summarize_many(chunks)
+      if not reduce or len(summaries) == 1:
+         return "\n".join(summaries) + "\n"
+      counts = token_counts(tokenizer, summaries)
+      packed = pack_chunks(summaries, counts, limit)
+      if len(packed) >= len(chunks):
+         # summaries do not shrink any more, stop instead of looping
+         return "\n".join(summaries) + "\n"
+      chunks = packed
+
+
+def legacy_chunks(history: str, tokenizer, limit: int) -> list[str]:
+   """Previous packing loop (re-tokenizes the growing chunk for every pair), kept as the benchmark baseline."""
+   messages = history.split('\n')
+   if len(messages) % 2:
+      messages.append("")
+   chunks, old_history, new_history = [], "", ""
+   for index in range(0, len(messages), 2):
+      new_history += messages[index] + messages[index + 1]
+      if len(tokenizer(new_history)['input_ids']) > limit:
+         chunks.append(old_history)
+         old_history, new_history = "", messages[index] + messages[index + 1]
+      old_history += messages[index] + messages[index + 1]
+   if old_history:
+      chunks.append(old_history)
+   return chunks
+
+
+def benchmark_chunking(tokenizer, lines: int = 10_000, limit: int = 867) -> dict:
+   """Chunking throughput on a synthetic transcript: legacy loop vs token-once packing."""
+   from src.util.bench import best_of
+
+   transcript = "\n".join(
+      f"user: line {i}, can you check why the deploy of service {i % 13} failed at step {i % 5}?" if i % 2 == 0 else
+      f"assistant: the job for service {i % 13} timed out while pulling the image; retrying with a warm cache should fix it."
+      for i in range(lines))
+   legacy = best_of(lambda: legacy_chunks(transcript, tokenizer, limit), repeat=1)
+   packed = best_of(lambda: chunk_transcript(transcript, tokenizer, limit), repeat=3)
+   report = {"lines": lines, "limit": limit,
+             "legacy_s": legacy, "legacy_lines_per_s": lines / legacy,
+             "packed_s": packed, "packed_lines_per_s": lines / packed,
+             "chunks": len(chunk_transcript(transcript, tokenizer, limit))}
+   print(report)
+   return report
+
+
+if __name__ == '__main__':
+   from transformers import AutoTokenizer
+
+   started = time.perf_counter()
+   benchmark_chunking(AutoTokenizer.from_pretrained('bart-large-cnn-samsum'))
+   print(f"total {time.perf_counter() - started:.1f}s")
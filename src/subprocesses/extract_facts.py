@@ -1,304 +1,391 @@
+import copy
 import datetime
+import hashlib
+import json
 import pathlib
-from collections import defaultdict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 
 from ollama import chat
 from langchain_core.output_parsers import JsonOutputParser
 
+from src.subprocesses.extraction_cache import ExtractionCache
 
-def extract_facts(messages: list):
-   parser = JsonOutputParser()
-   pth = pathlib.Path(__file__).parent
-   with open(str(pth) + '/prompts/extract_facts.md', 'r') as fp:
-      prompt = fp.read()
-
-   tools = [{
-      "type": "function",
-      "function": {
-         "name": "emit_parcels_draft",
-         "description": "Extract user-stated facts/preferences/goals/etc. from the CURRENT user message only.",
-         "parameters": {
-            "type": "object",
-            "properties": {
-               "context": {
-                  "type": "object",
-                  "properties": {
-                     "mode": {"type": ["string", "null"]},
-                     "task": {"type": ["string", "null"]},
-                     "step": {"type": ["integer", "null"]}
-                  },
-                  "additionalProperties": False
+MODEL = 'llama3.1'
+OPTIONS = {'temperatur': 0.0, "tools": "required", 'top_p': 0.1, "top_k": 20}
+PROMPT_PATH = pathlib.Path(__file__).parent / 'prompts' / 'extract_facts.md'
+
+TOOLS = [{
+   "type": "function",
+   "function": {
+      "name": "emit_parcels_draft",
+      "description": "Extract user-stated facts/preferences/goals/etc. from the CURRENT user message only.",
+      "parameters": {
+         "type": "object",
+         "properties": {
+            "context": {
+               "type": "object",
+               "properties": {
+                  "mode": {"type": ["string", "null"]},
+                  "task": {"type": ["string", "null"]},
+                  "step": {"type": ["integer", "null"]}
                },
-               "flags": {
-                  "type": "object",
-                  "properties": {
-                     "awaiting_user_data": {"type": "boolean"},
-                     "needs_clarification": {"type": "boolean"},
-                     "memory_conflict": {"type": "boolean"},
-                     "high_confidence_update": {"type": "boolean"}
-                  },
-                  "required": ["awaiting_user_data", "needs_clarification", "high_confidence_update"],
-                  "additionalProperties": False
+               "additionalProperties": False
+            },
+            "flags": {
+               "type": "object",
+               "properties": {
+                  "awaiting_user_data": {"type": "boolean"},
+                  "needs_clarification": {"type": "boolean"},
+                  "memory_conflict": {"type": "boolean"},
+                  "high_confidence_update": {"type": "boolean"}
+               },
+               "required": ["awaiting_user_data", "needs_clarification", "high_confidence_update"],
+               "additionalProperties": False
+            },
+            "scratch": {
+               "type": "object",
+               "properties": {
+                  "reasoning": {"type": ["string", "null"]},
+                  "skipped_items": {"type": ["string", "null"]}
                },
-               "scratch": {
+               "additionalProperties": False
+            },
+            "parcels_draft": {
+               "type": "array",
+               "maxItems": 5,
+               "items": {
                   "type": "object",
                   "properties": {
-                     "reasoning": {"type": ["string", "null"]},
-                     "skipped_items": {"type": ["string", "null"]}
+                     "type": {"type": "string", "enum": ["preference", "fact", "profile", "event", "task", "rule", "summary", "mood", "identity"]},
+                     "predicate": {"type": "string"},
+                     "value": {},
+                     "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                     "stability": {"type": "number", "minimum": 0, "maximum": 1},
+                     "salience": {"type": "number", "minimum": 0, "maximum": 1},
+                     "evidence": {"type": "string"},
+                     "tags": {"type": "array", "items": {"type": "string"}},
+                     "subject": {"type": "string"}
                   },
+                  "required": ["type", "predicate", "value", "confidence", "stability", "evidence"],
                   "additionalProperties": False
-               },
-               "parcels_draft": {
-                  "type": "array",
-                  "maxItems": 5,
-                  "items": {
-                     "type": "object",
-                     "properties": {
-                        "type": {"type": "string", "enum": ["preference", "fact", "profile", "event", "task", "rule", "summary", "mood", "identity"]},
-                        "predicate": {"type": "string"},
-                        "value": {},
-                        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
-                        "stability": {"type": "number", "minimum": 0, "maximum": 1},
-                        "salience": {"type": "number", "minimum": 0, "maximum": 1},
-                        "evidence": {"type": "string"},
-                        "tags": {"type": "array", "items": {"type": "string"}},
-                        "subject": {"type": "string"}
-                     },
-                     "required": ["type", "predicate", "value", "confidence", "stability", "evidence"],
-                     "additionalProperties": False
-                  }
                }
-            },
-            "required": ["context", "flags", "scratch", "parcels_draft"],
-            "additionalProperties": False
-         }
+            }
+         },
+         "required": ["context", "flags", "scratch", "parcels_draft"],
+         "additionalProperties": False
       }
-   }]
-
-   examples = [
-      {
-         "role": "user",
-         "content": "Can you teach me some opening chess moves?"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_1",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": "teach", "step": 1},
-                  "parcels_draft": [
-                     {
-                        "type": "task",
-                        "predicate": "goal",
-                        "value": "chess",
-                        "confidence": 0.70,
-                        "stability": 0.30,
-                        "salience": 0.6,
-                        "subject": "user",
-                        "tags": ["boardgame", "beginner", 'education'],
-                        "evidence": "Can you teach me some opening chess moves?"
-                     }
-                  ],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+   }
+}]
+
+EXAMPLES = [
+   {
+      "role": "user",
+      "content": "Can you teach me some opening chess moves?"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_1",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": "teach", "step": 1},
+               "parcels_draft": [
+                  {
+                     "type": "task",
+                     "predicate": "goal",
+                     "value": "chess",
+                     "confidence": 0.70,
+                     "stability": 0.30,
+                     "salience": 0.6,
+                     "subject": "user",
+                     "tags": ["boardgame", "beginner", 'education'],
+                     "evidence": "Can you teach me some opening chess moves?"
+                  }
+               ],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }, {
-         "role": "user",
-         "content": "okay"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_2",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": None, "step": None},
-                  "parcels_draft": [],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+         }
+      }]
+   }, {
+      "role": "user",
+      "content": "okay"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_2",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": None, "step": None},
+               "parcels_draft": [],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }, {
-         "role": "user",
-         "content": "It's cold outside"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_3",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": None, "step": None},
-                  "parcels_draft": [
-                     {
-                        "type": "event",
-                        "predicate": "condition",
-                        "value": "cold outside",
-                        "confidence": 0.95,
-                        "stability": 0.30,
-                        "salience": 0.5,
-                        "subject": "user",
-                        "tags": ["weather"],
-                        "evidence": "cold outside"
-                     }
-                  ],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+         }
+      }]
+   }, {
+      "role": "user",
+      "content": "It's cold outside"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_3",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": None, "step": None},
+               "parcels_draft": [
+                  {
+                     "type": "event",
+                     "predicate": "condition",
+                     "value": "cold outside",
+                     "confidence": 0.95,
+                     "stability": 0.30,
+                     "salience": 0.5,
+                     "subject": "user",
+                     "tags": ["weather"],
+                     "evidence": "cold outside"
+                  }
+               ],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }, {
-         "role": "user",
-         "content": "Chocolate ice cream is yummy"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_4",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": None, "step": None},
-                  "parcels_draft": [
-                     {
-                        "type": "preference",
-                        "predicate": "likes",
-                        "value": "chocolate ice cream",
-                        "confidence": 0.95,
-                        "stability": 0.9,
-                        "salience": 0.85,
-                        "subject": "user",
-                        "tags": ["food"],
-                        "evidence": "Chocolate ice cream is yummy"
-                     }
-                  ],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+         }
+      }]
+   }, {
+      "role": "user",
+      "content": "Chocolate ice cream is yummy"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_4",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": None, "step": None},
+               "parcels_draft": [
+                  {
+                     "type": "preference",
+                     "predicate": "likes",
+                     "value": "chocolate ice cream",
+                     "confidence": 0.95,
+                     "stability": 0.9,
+                     "salience": 0.85,
+                     "subject": "user",
+                     "tags": ["food"],
+                     "evidence": "Chocolate ice cream is yummy"
+                  }
+               ],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }, {
-         "role": "user",
-         "content": "Do you want to play chess?"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_5",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": 'play chess', "step": 1},
-                  "parcels_draft": [
-                     {
-                        "type": "task",
-                        "predicate": "play",
-                        "value": "play chess",
-                        "confidence": 0.95,
-                        "stability": 0.9,
-                        "salience": 0.4,
-                        "subject": "user",
-                        "tags": ["boardgame", "tool use"],
-                        "evidence": "Do you want to play chess?"
-                     }
-                  ],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+         }
+      }]
+   }, {
+      "role": "user",
+      "content": "Do you want to play chess?"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_5",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": 'play chess', "step": 1},
+               "parcels_draft": [
+                  {
+                     "type": "task",
+                     "predicate": "play",
+                     "value": "play chess",
+                     "confidence": 0.95,
+                     "stability": 0.9,
+                     "salience": 0.4,
+                     "subject": "user",
+                     "tags": ["boardgame", "tool use"],
+                     "evidence": "Do you want to play chess?"
+                  }
+               ],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }, {
-         "role": "user",
-         "content": "It's raining outside and I do not like the rain"
-      },
-      {
-         "role": "assistant",
-         "tool_calls": [{
-            "id": "call_6",
-            "type": "function",
-            "function": {
-               "name": "emit_parcels_draft",
-               "arguments": {
-                  "context": {"mode": None, "task": None, "step": None},
-                  "parcels_draft": [
-                     {"type": "event", "predicate": "weather", "value": "raining", "confidence": 0.9, "stability": 0.3, "salience": 0.4, "evidence": "It’s raining outside", "tags": ["weather"], "subject": "outside"},
-                     {"type": "preference", "predicate": "dislikes", "value": "rain", "confidence": 0.9, "stability": 0.7, "salience": 0.8, "evidence": "I do not like the rain", "tags": ["weather"], "subject": "user"}
-                  ],
-                  "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
-                  "scratch": {"reasoning": None, "skipped_items": None}
-               }
+         }
+      }]
+   }, {
+      "role": "user",
+      "content": "It's raining outside and I do not like the rain"
+   },
+   {
+      "role": "assistant",
+      "tool_calls": [{
+         "id": "call_6",
+         "type": "function",
+         "function": {
+            "name": "emit_parcels_draft",
+            "arguments": {
+               "context": {"mode": None, "task": None, "step": None},
+               "parcels_draft": [
+                  {"type": "event", "predicate": "weather", "value": "raining", "confidence": 0.9, "stability": 0.3, "salience": 0.4, "evidence": "It’s raining outside", "tags": ["weather"], "subject": "outside"},
+                  {"type": "preference", "predicate": "dislikes", "value": "rain", "confidence": 0.9, "stability": 0.7, "salience": 0.8, "evidence": "I do not like the rain", "tags": ["weather"], "subject": "user"}
+               ],
+               "flags": {"awaiting_user_data": False, "needs_clarification": False, "high_confidence_update": False},
+               "scratch": {"reasoning": None, "skipped_items": None}
             }
-         }]
-      }
-   ]
-   messages = ['I think pizza is delicous ', "It's raining outside", "My favorite pets are cats.", 'yes go ahead', "Do you want to play poker", "I understand", "I prefer python", "i just came from outside, and man i do hate snow!"]
-   # messages = ['I think pizza is delicous ', "My favorite pets are cats."]
-   result = {}
-   for m in messages:
-      resp = chat(model='llama3.1',
-                  tools=tools,
-                  messages=[{'role': 'system', 'content': prompt}] + examples + [{"role": "user", "content": m}],  # examples +
-                  options={'temperatur': 0.0, "tools": "required", 'top_p': 0.1, "top_k": 20})
-      try:
-         mem = resp.message.tool_calls[0].function.arguments if len(resp.message.tool_calls) > 0 else {}
-         for parcels_draft in mem['parcels_draft']:
-            parcels_draft['last_seen'] = datetime.datetime.utcnow().isoformat(timespec="seconds")
-         result[m] = mem
-      except TypeError:
-         parsed = parser.parse(resp.message.content)
-
-         mem = parsed['parameters'] if 'parameters' in parsed else parsed
-         for parcels_draft in mem['parcels_draft']:
-            parcels_draft['last_seen'] = datetime.datetime.utcnow().isoformat(timespec="seconds")
-      result[m] = resp.message.tool_calls[0].function.arguments if len(resp.message.tool_calls) > 0 else {}
-
-   [print(f"Input:\n{k}\n\nOutput:\n{v}\n") for k, v in result.items()]
-   schema = {
-      "context": {
-         "mode": None,
-         "task": None,
-         "step": None
-      },
-      "facts": [
-         {
-            "predicate": "",
-            'entity': "",
-            "value": "",
-            "confidence": 0.5,
-            "stability": 0.5,
-            "last_seen": datetime.datetime.utcnow(),
-            "evidence": "",
-            'context': ""
          }
-      ],
-      "flags": {
-         'awaiting_user_data': False,
-         'high_confidence_update': False,
-         'memory_conflict': False,
-         'needs_clarification': False
-      },
-      "prefs": {
-         'dislikes': [""],
-         'likes': [""],
-         'style': {}
-      },
-      "scratch": {
-         'reasoning': None,
-         'skipped_items': None}
+      }]
    }
-   return list(result.values())
+]
+
+# Multi-message mode: same tool, tagged with the index of the message it belongs to.
+BATCH_TOOLS = copy.deepcopy(TOOLS)
+BATCH_TOOLS[0]["function"]["parameters"]["properties"]["index"] = {"type": "integer", "minimum": 0}
+BATCH_TOOLS[0]["function"]["parameters"]["required"].append("index")
+BATCH_INSTRUCTIONS = """
+
+Batch mode:
+The user turn contains several numbered messages, one per line as `[index] message`.
+Treat every message as its own CURRENT user message and make exactly one `emit_parcels_draft` call per message, with `index` set to its number.
+"""
+
+@dataclass
+class BatchReport:
+   messages: int
+   requests: int
+   concurrency: int
+   per_request: int
+   wall: float
+   cached: int = 0
+
+   @property
+   def per_message(self) -> float:
+      return self.wall / self.messages if self.messages else 0.0
+
+
+@lru_cache(maxsize=None)
+def _prefix(batched: bool) -> tuple:
+   """System prompt + few-shot examples, built once per worker process."""
+   prompt = PROMPT_PATH.read_text('utf-8')
+   if batched:
+      prompt += BATCH_INSTRUCTIONS
+   return tuple([{'role': 'system', 'content': prompt}] + EXAMPLES)
+
+
+@lru_cache(maxsize=None)
+def extraction_version() -> str:
+   """
+   Changes whenever the model, prompt, tool schema or examples change, which invalidates cached extractions.
+   Covers both the single-message and the batch prompt/tools (BATCH_INSTRUCTIONS is part of _prefix(True)):
+   results of either mode are cached under this one version.
+   """
+   base = json.dumps([MODEL, OPTIONS, _prefix(False), TOOLS, _prefix(True), BATCH_TOOLS], sort_keys=True, default=str)
+   return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def extraction_cache() -> ExtractionCache:
+   return ExtractionCache()
+
+
+def extraction_stats() -> dict:
+   """Hits and misses of this process's extraction cache (the pool worker's, where extract_facts runs)."""
+   return {**extraction_cache().stats(), "version": extraction_version()}
+
+
+def _stamp(mem: dict) -> dict:
+   for parcels_draft in mem.get('parcels_draft', []):
+      parcels_draft['last_seen'] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+   return mem
+
+
+def _tool_arguments(resp) -> list[dict]:
+   try:
+      return [call.function.arguments for call in resp.message.tool_calls]
+   except TypeError:
+      # no tool calls, model answered in plain text
+      parsed = JsonOutputParser().parse(resp.message.content)
+      return [parsed['parameters'] if 'parameters' in parsed else parsed]
+
+
+def _extract_one(message: str) -> dict:
+   resp = chat(model=MODEL,
+               tools=TOOLS,
+               messages=list(_prefix(False)) + [{"role": "user", "content": message}],
+               options=OPTIONS)
+   calls = _tool_arguments(resp)
+   return _stamp(calls[0]) if calls else {}
+
+
+def _extract_many(messages: list[str]) -> list[dict]:
+   if len(messages) == 1:
+      return [_extract_one(messages[0])]
+   content = "\n".join(f"[{i}] {m}" for i, m in enumerate(messages))
+   resp = chat(model=MODEL,
+               tools=BATCH_TOOLS,
+               messages=list(_prefix(True)) + [{"role": "user", "content": content}],
+               options=OPTIONS)
+   by_index = {}
+   for args in _tool_arguments(resp):
+      index = args.pop('index', None)
+      if isinstance(index, int) and 0 <= index < len(messages) and index not in by_index:
+         by_index[index] = _stamp(args)
+   # anything the model skipped gets a regular single-message call
+   return [by_index[i] if i in by_index else _extract_one(m) for i, m in enumerate(messages)]
+
+
+def extract_facts_batch(messages: list, *, concurrency: int = 4, per_request: int = 1, use_cache: bool = True) -> tuple[list[dict], BatchReport]:
+   """
+   Extract parcels for every message, one result per message in input order.
+   concurrency: requests in flight at once; per_request: messages packed into one request.
+   Messages already in the extraction cache (or repeated within the batch) never reach the LLM.
+   """
+   started = time.perf_counter()
+   cache = extraction_cache() if use_cache else None
+   version = extraction_version()
+   results: list[dict | None] = [None] * len(messages)
+   pending: dict[str, list[int]] = {}
+   for i, m in enumerate(messages):
+      hit = cache.get(m, version) if cache else None
+      if hit is not None:
+         results[i] = _stamp(hit)
+      else:
+         pending.setdefault(m, []).append(i)
+
+   todo = list(pending)
+   groups = [todo[i:i + per_request] for i in range(0, len(todo), max(1, per_request))]
+   if groups:
+      with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups)))) as ex:
+         for group, group_result in zip(groups, ex.map(_extract_many, groups)):
+            for m, mem in zip(group, group_result):
+               if cache:
+                  cache.put(m, version, mem)
+               for i in pending[m]:
+                  results[i] = copy.deepcopy(mem)
+   report = BatchReport(messages=len(messages), requests=len(groups), concurrency=concurrency,
+                        per_request=per_request, wall=time.perf_counter() - started,
+                        cached=len(messages) - len(todo))
+   return results, report
+
+
+def extract_facts(messages: list):
+   results, report = extract_facts_batch(messages)
+   stats = extraction_stats()
+   print(f"extract_facts: {report.messages} messages ({report.cached} cached) in {report.requests} requests, "
+         f"{report.wall:.2f}s ({report.per_message:.2f}s/message); cache {stats['hits']} hits, {stats['misses']} misses, "
+         f"{stats['entries']} entries")
+   return results
 
 
 def normalize_memory(payload):
@@ -344,4 +431,9 @@ def normalize_memory(payload):
 
 
 if __name__ == "__main__":
-   memories = extract_facts([])
+   messages = ['I think pizza is delicous ', "It's raining outside", "My favorite pets are cats.", 'yes go ahead', "Do you want to play poker", "I understand", "I prefer python", "i just came from outside, and man i do hate snow!"]
+   for per_request in (1, 4):
+      memories, report = extract_facts_batch(messages, concurrency=4, per_request=per_request)
+      [print(f"Input:\n{k}\n\nOutput:\n{v}\n") for k, v in zip(messages, memories)]
+      print(report)
+   print(extraction_stats())
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import pathlib
+import re
+import sqlite3
+import time
+from threading import Lock
+
+DEFAULT_PATH = pathlib.Path(__file__).parent / 'cache' / 'extract_facts.sqlite'
+
+
+def normalize_message(message: str) -> str:
+   return re.sub(r"\s+", " ", (message or "").strip()).casefold()
+
+
+def cache_key(message: str, version: str) -> str:
+   """Deterministic id of an extraction: same normalized text + same prompt/model version -> same result."""
+   base = f"{version}|{normalize_message(message)}"
+   return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+   """
+   Persistent, content-addressed cache of extract_facts results:
+     - SQLite file, shared by every worker process and kept across sessions.
+     - Keyed by sha256(version | normalized message), so a prompt/model change never serves stale results.
+     - Bounded by entry count and payload bytes (LRU on last access) plus a TTL.
+   """
+
+   def __init__(
+         self,
+         path: str | pathlib.Path = DEFAULT_PATH,
+         max_entries: int = 10_000,
+         max_bytes: int = 32 * 1024 * 1024,
+         ttl: int | None = 30 * 24 * 3600,
+   ):
+      self.path = pathlib.Path(path)
+      self.path.parent.mkdir(parents=True, exist_ok=True)
+      self.max_entries = max_entries
+      self.max_bytes = max_bytes
+      self.ttl = ttl
+      self.hits = 0
+      self.misses = 0
+      self._lock = Lock()
+      self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+      self._db.execute("""
+         CREATE TABLE IF NOT EXISTS extractions (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+         )""")
+      self._db.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed)")
+      self._db.commit()
+
+   def get(self, message: str, version: str) -> dict | None:
+      key = cache_key(message, version)
+      now = time.time()
+      with self._lock:
+         row = self._db.execute("SELECT value, created FROM extractions WHERE key = ?", (key,)).fetchone()
+         if row is None or (self.ttl and now - row[1] > self.ttl):
+            self.misses += 1
+            return None
+         self._db.execute("UPDATE extractions SET accessed = ? WHERE key = ?", (now, key))
+         self._db.commit()
+         self.hits += 1
+      return json.loads(row[0])
+
+   def put(self, message: str, version: str, result: dict) -> None:
+      payload = json.dumps(result, separators=(",", ":"), default=str)
+      now = time.time()
+      with self._lock:
+         self._db.execute("INSERT OR REPLACE INTO extractions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                          (cache_key(message, version), payload, len(payload.encode("utf-8")), now, now))
+         self._evict(now)
+         self._db.commit()
+
+   def _evict(self, now: float) -> None:
+      if self.ttl:
+         self._db.execute("DELETE FROM extractions WHERE created < ?", (now - self.ttl,))
+      entries, used = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+      if entries <= self.max_entries and used <= self.max_bytes:
+         return
+      # drop least recently used rows until both bounds hold again
+      for key, size in self._db.execute("SELECT key, size FROM extractions ORDER BY accessed").fetchall():
+         if entries <= self.max_entries and used <= self.max_bytes:
+            break
+         self._db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+         entries -= 1
+         used -= size
+
+   def clear(self) -> None:
+      with self._lock:
+         self._db.execute("DELETE FROM extractions")
+         self._db.commit()
+
+   def stats(self) -> dict:
+      with self._lock:
+         entries, used = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+      lookups = self.hits + self.misses
+      return {
+         "hits": self.hits,
+         "misses": self.misses,
+         "hit_rate": self.hits / lookups if lookups else 0.0,
+         "entries": entries,
+         "bytes_used": used,
+      }
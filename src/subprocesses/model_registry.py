@@ -0,0 +1,105 @@
+import gc
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import RLock
+
+
+class ModelRegistryMeta(type):
+   _instances = {}
+
+   @classmethod
+   def __call__(mcs, *args, **kwargs):
+      if mcs not in mcs._instances:
+         instance = super().__call__(ModelRegistry, *args, **kwargs)
+         mcs._instances[mcs] = instance
+      return mcs._instances[mcs]
+
+
+@dataclass
+class ResidentModel:
+   key: tuple
+   pipeline: object
+   bytes: int
+   load_time: float
+   hits: int = 0
+
+
+def model_bytes(pipe) -> int:
+   """Parameter + buffer bytes of the pipeline's torch model (0 for anything else)."""
+   model = getattr(pipe, "model", None)
+   if model is None or not hasattr(model, "parameters"):
+      return 0
+   tensors = list(model.parameters()) + list(model.buffers())
+   return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry(metaclass=ModelRegistryMeta):
+   """
+   Process-wide cache of Hugging Face pipelines shared by the summarizers and analyze_intent:
+     - A pipeline is built on first use and reused afterwards (weights load once per process).
+     - Resident models form an LRU bounded by MODEL_REGISTRY_BYTES (default 4 GiB); the least recently used
+       ones are dropped when a new load goes over the bound. A model larger than the bound still loads alone.
+     - stats() reports load time, resident bytes and hits per model.
+   """
+   models: OrderedDict
+   max_bytes: int
+   evictions: int
+
+   def __init__(self):
+      self.models = OrderedDict()
+      self.max_bytes = int(os.environ.get("MODEL_REGISTRY_BYTES", 4 * 1024 ** 3))
+      self.evictions = 0
+      self._lock = RLock()
+
+   def pipeline(self, task: str, model: str, tokenizer: str | None = None, **kwargs):
+      key = (task, model, tokenizer, tuple(sorted(kwargs.items())))
+      with self._lock:
+         resident = self.models.get(key)
+         if resident is None:
+            from transformers import pipeline
+            started = time.perf_counter()
+            pipe = pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+            resident = ResidentModel(key=key, pipeline=pipe, bytes=model_bytes(pipe), load_time=time.perf_counter() - started)
+            print(f"model_registry: loaded {model} ({task}) in {resident.load_time:.1f}s, {resident.bytes / 1024 ** 2:.0f} MiB")
+            self.models[key] = resident
+            self._evict(keep=key)
+         else:
+            self.models.move_to_end(key)
+         resident.hits += 1
+         return resident.pipeline
+
+   def resident_bytes(self) -> int:
+      return sum(m.bytes for m in self.models.values())
+
+   def _evict(self, keep: tuple):
+      evicted = False
+      while self.resident_bytes() > self.max_bytes and len(self.models) > 1:
+         key = next(iter(self.models))
+         if key == keep:
+            self.models.move_to_end(key)
+            continue
+         del self.models[key]
+         self.evictions += 1
+         evicted = True
+      if evicted:
+         gc.collect()
+
+   def unload(self, model: str | None = None):
+      """Drop one model (every task/tokenizer variant of it), or all of them."""
+      with self._lock:
+         for key in [k for k in self.models if model in (None, k[1])]:
+            del self.models[key]
+         gc.collect()
+
+   def stats(self) -> dict:
+      with self._lock:
+         return {
+            "resident": len(self.models),
+            "resident_bytes": self.resident_bytes(),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "models": [{"task": m.key[0], "model": m.key[1], "bytes": m.bytes, "load_time": m.load_time, "hits": m.hits}
+                       for m in self.models.values()],
+         }
@@ -1,39 +1,42 @@
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
-from transformers import pipeline
-
-
-def summarized_chucked(history: str):
-   from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-   messages = history.split('\n')
-   old_history = ""
-   new_history = ""
-   summary = ""
-   tokenizer = AutoTokenizer.from_pretrained('bart-large-cnn-samsum')
-   model = AutoModelForSeq2SeqLM.from_pretrained('bart/bart-large-cnn-samsum')
-   Pipeline = pipeline("summarization", model=model, tokenizer=tokenizer)
-   index = 0
-   kwargs = {"length_penalty": 0.8, "num_beams": 8, "max_length": 256}
-   while index < len(messages):
-      new_history += messages[index]
-      new_history += messages[index + 1]
-      tokens = tokenizer(new_history)
-      if len(tokens['input_ids']) > 867:
-         summary += Pipeline(old_history, **kwargs)[0]['summary_text'] + '\n'
-         old_history = ""
-         new_history = ""
-         new_history += messages[index]
-         new_history += messages[index + 1]
-      old_history += messages[index]
-      old_history += messages[index + 1]
-      index += 2
-   if old_history != "":
-      tokens = tokenizer(old_history)['input_ids']
-      if len(tokens) < 256:
-         kwargs['max_length'] = len(tokens) // 2
-      summary += Pipeline(old_history, **kwargs)[0]['summary_text'] + '\n'
-   return summary
+
+from src.subprocesses.chunker import Chunk, chunk_transcript, map_reduce
+from src.subprocesses.model_registry import ModelRegistry
+
+
+def _summarize_chunked(history: str, model: str, tokenizer: str, limit: int, max_length: int,
+                       reduce: bool = True, batch_size: int = 4) -> str:
+   """Pack the transcript into chunks of at most `limit` tokens, summarize them in batches, then reduce."""
+   Pipeline = ModelRegistry().pipeline("summarization", model=model, tokenizer=tokenizer)
+   chunks = chunk_transcript(history, Pipeline.tokenizer, limit)
+   if not chunks:
+      return ""
+
+   def summarize_many(batch: list[Chunk]) -> list[str]:
+      # short chunks get a proportionally short summary, group chunks sharing the same max_length
+      groups: dict[int, list[int]] = {}
+      for i, chunk in enumerate(batch):
+         groups.setdefault(max_length if chunk.tokens >= max_length else max(chunk.tokens // 2, 1), []).append(i)
+      summaries = [""] * len(batch)
+      for length, indexes in groups.items():
+         outputs = Pipeline([batch[i].text for i in indexes], batch_size=batch_size, truncation=True,
+                            length_penalty=0.8, num_beams=8, max_length=length)
+         for i, out in zip(indexes, outputs):
+            summaries[i] = (out[0] if isinstance(out, list) else out)['summary_text']
+      return summaries
+
+   return map_reduce(chunks, summarize_many, Pipeline.tokenizer, limit, reduce=reduce)
+
+
+def summarized_chucked(history: str, reduce: bool = True):
+   return _summarize_chunked(history, model='bart/bart-large-cnn-samsum', tokenizer='bart-large-cnn-samsum',
+                             limit=867, max_length=256, reduce=reduce)
 
 
 def summarized_llm(history: str):
@@ -63,71 +66,106 @@ INPUT:""")
    print(response)
 
 
-def summarized_pipeline_large(history: str):
-   from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-   messages = history.split('\n')
-
-   old_history = ""
-   new_history = ""
-   summary = ""
-   tokenizer = AutoTokenizer.from_pretrained('bigbird-pegasus-large-pubmed')
-   model = AutoModelForSeq2SeqLM.from_pretrained('bigbird-pegasus-large-pubmed')
-   Pipeline = pipeline("summarization", model=model, tokenizer=tokenizer)
-   index = 0
-   kwargs = {"length_penalty": 0.8, "num_beams": 8, "max_length": 1024}
-   while index < len(messages):
-      new_history += messages[index]
-      new_history += messages[index + 1]
-      tokens = tokenizer(new_history)
-      if len(tokens['input_ids']) > 3939:
-         summary += Pipeline(old_history, **kwargs)[0]['summary_text'] + '\n'
-         old_history = ""
-         new_history = ""
-         new_history += messages[index]
-         new_history += messages[index + 1]
-      old_history += messages[index]
-      old_history += messages[index + 1]
-      index += 2
-   if old_history != "":
-      tokens = tokenizer(old_history)['input_ids']
-      if len(tokens) < 1024:
-         kwargs['max_length'] = len(tokens) // 2
-      summary += Pipeline(old_history, **kwargs)[0]['summary_text'] + '\n'
-   return summary
+def summarized_pipeline_large(history: str, reduce: bool = True):
+   return _summarize_chunked(history, model='bigbird-pegasus-large-pubmed', tokenizer='bigbird-pegasus-large-pubmed',
+                             limit=3939, max_length=1024, reduce=reduce)
 
 
-def summarized_classic(history: str):
+CLASSIC_MODEL = "llama3.2"
+
+
+@dataclass
+class PassReport:
+   name: str
+   prompt_eval_tokens: int
+   prompt_eval_s: float
+   eval_tokens: int
+   wall_s: float
+
+
+@lru_cache(maxsize=None)
+def _classic_prompts() -> tuple[SystemMessage, SystemMessage]:
    with open('summarize.md', mode='r') as fp:
-      content = fp.read()
+      system_main = SystemMessage(content=fp.read())
    with open('summarize_output.md', mode='r') as fp:
       system_out = SystemMessage(content=fp.read())
+   return system_main, system_out
 
-   system_main = SystemMessage(content=content)
-   messages = [system_main, HumanMessage(content=history), AIMessage(content=''), system_out, HumanMessage(content=history)]
-   prompt = ChatPromptTemplate.from_messages(messages)
 
-   llm = ChatOllama(model="llama3.2", temperature=0, base_url="http://localhost:11434")
+@lru_cache(maxsize=None)
+def _classic_llm() -> ChatOllama:
+   return ChatOllama(model=CLASSIC_MODEL, temperature=0, base_url="http://localhost:11434")
 
-   chain = prompt | llm
-   inputs = {"input": history}
-   response = chain.invoke(inputs)
 
-   messages.append(response)
-   messages.append(HumanMessage(content=''))
-   inputs = {"input": history}
-   prompt = ChatPromptTemplate.from_messages(messages)
-   chain = prompt | llm
-   response = chain.invoke(inputs)
+def _run_pass(name: str, messages: list, reports: list[PassReport]):
+   started = time.perf_counter()
+   response = _classic_llm().invoke(messages)
+   meta = getattr(response, 'response_metadata', None) or {}
+   reports.append(PassReport(name=name,
+                             prompt_eval_tokens=meta.get('prompt_eval_count') or 0,
+                             prompt_eval_s=(meta.get('prompt_eval_duration') or 0) / 1e9,
+                             eval_tokens=meta.get('eval_count') or 0,
+                             wall_s=time.perf_counter() - started))
+   return response
 
-   messages.append(response)
-   messages.append(HumanMessage(content=history))
-   inputs = {"input": history}
-   prompt = ChatPromptTemplate.from_messages(messages)
-   chain = prompt | llm
-   response = chain.invoke(inputs)
+
+def _yesterday_heading(response) -> str:
    txt = response.content if hasattr(response, 'content') else response
    txt: str = txt.replace('**Summary**', "# Yesterday's Session:")
    if "# Yesterday's Session:" not in txt:
-      txt = txt[txt.index(':') + 1:]
+      txt = txt[txt.index(':') + 1:] if ':' in txt else txt
       txt = "# Yesterday's Session:\n" + txt
    return txt
+
+
+def summarized_classic_passes(history: str) -> tuple[str, list[PassReport]]:
+   """
+   Three passes over one growing conversation: every pass only appends to the previous pass's messages,
+   so the transcript appears once and the backend can reuse the context it already evaluated for it.
+     1. summarize.md + transcript            -> draft
+     2. + draft + continue                   -> refinement
+     3. + refinement + summarize_output.md   -> final text
+   """
+   system_main, system_out = _classic_prompts()
+   reports: list[PassReport] = []
+   messages = [system_main, HumanMessage(content=history)]
+   response = _run_pass("draft", messages, reports)
+   messages += [response, HumanMessage(content='')]
+   response = _run_pass("refine", messages, reports)
+   messages += [response, system_out, HumanMessage(content='Write the final summary of the conversation above.')]
+   response = _run_pass("final", messages, reports)
+   return _yesterday_heading(response), reports
+
+
+def summarized_classic_legacy(history: str) -> tuple[str, list[PassReport]]:
+   """Previous flow (transcript repeated in every pass), kept to compare prompt-eval cost against."""
+   system_main, system_out = _classic_prompts()
+   reports: list[PassReport] = []
+   messages = [system_main, HumanMessage(content=history), AIMessage(content=''), system_out, HumanMessage(content=history)]
+   response = _run_pass("legacy-1", messages, reports)
+   messages += [response, HumanMessage(content='')]
+   response = _run_pass("legacy-2", messages, reports)
+   messages += [response, HumanMessage(content=history)]
+   response = _run_pass("legacy-3", messages, reports)
+   return _yesterday_heading(response), reports
+
+
+def summarized_classic(history: str):
+   txt, reports = summarized_classic_passes(history)
+   for r in reports:
+      print(f"summarized_classic[{r.name}] prompt_eval={r.prompt_eval_tokens} tok in {r.prompt_eval_s:.2f}s, "
+            f"eval={r.eval_tokens} tok, wall={r.wall_s:.2f}s")
+   return txt
+
+
+def compare_classic(history: str) -> dict:
+   """Prompt-eval tokens and wall time of the legacy flow vs the prefix-reusing passes, on the same transcript."""
+   _, legacy = summarized_classic_legacy(history)
+   _, passes = summarized_classic_passes(history)
+   report = {name: {"prompt_eval_tokens": sum(r.prompt_eval_tokens for r in rs),
+                    "prompt_eval_s": sum(r.prompt_eval_s for r in rs),
+                    "wall_s": sum(r.wall_s for r in rs),
+                    "passes": [(r.name, r.prompt_eval_tokens, round(r.wall_s, 2)) for r in rs]}
+             for name, rs in (("legacy", legacy), ("prefix", passes))}
+   print(report)
+   return report
@@ -0,0 +1,35 @@
+import pathlib
+from functools import lru_cache
+
+from ollama import chat
+
+MODEL = 'llama3.2'
+OPTIONS = {'temperature': 0.0, 'num_predict': 400}
+PROMPT_PATH = pathlib.Path(__file__).parent / 'prompts' / 'summarize_rolling.md'
+MAX_CHARS = 1600
+
+
+@lru_cache(maxsize=None)
+def _system() -> dict:
+   return {'role': 'system', 'content': PROMPT_PATH.read_text('utf-8')}
+
+
+def summarize_rolling(previous: str, turns: list[str]) -> str:
+   """Fold turns that left the prompt window into the running session summary; returns the new summary."""
+   if not turns:
+      return previous
+   content = f"CURRENT SUMMARY:\n{previous or '(empty)'}\n\nTURNS TO FOLD IN:\n" + "\n".join(turns)
+   resp = chat(model=MODEL,
+               messages=[_system(), {'role': 'user', 'content': content}],
+               options=OPTIONS)
+   summary = (resp.message.content or "").strip()
+   if not summary:
+      # keep what we had rather than wiping the summary on an empty answer
+      return previous
+   return summary[:MAX_CHARS]
+
+
+if __name__ == '__main__':
+   print(summarize_rolling("", ["user: I'm migrating our CI from Jenkins to GitHub Actions.",
+                                "assistant: Sounds good, which part do you want to start with?",
+                                "user: The deploy job, it needs the staging secrets."]))
@@ -0,0 +1,151 @@
+import atexit
+import gzip
+import json
+import pathlib
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_DIR = pathlib.Path(__file__).parent.parent / 'archive'
+
+_STOP = object()
+
+
+class ArchiveWriter:
+   """
+   Background archive sink for STMStorage (pass the instance as archive_sink):
+     - Calling it only enqueues the batch; a daemon thread does the file I/O.
+     - Buffered lines are flushed every `flush_messages` messages or `flush_interval` seconds,
+       each flush as one gzip member appended to the current JSONL segment.
+     - Segments rotate once they reach `segment_bytes` (compressed).
+     - Bounded memory: at most `max_pending` batches wait in the queue. A full queue blocks the caller
+       for up to `put_timeout` seconds, then the batch is dropped and counted (see stats()). Lines of a failed
+       write are counted as dropped too.
+     - close() drains and flushes everything; it also runs at interpreter exit.
+   """
+
+   def __init__(
+         self,
+         directory: str | pathlib.Path = DEFAULT_DIR,
+         name: str = "stm",
+         flush_messages: int = 500,
+         flush_interval: float = 2.0,
+         segment_bytes: int = 8 * 1024 * 1024,
+         max_pending: int = 1000,
+         put_timeout: float = 0.05,
+   ):
+      self.directory = pathlib.Path(directory)
+      self.name = name
+      self.flush_messages = flush_messages
+      self.flush_interval = flush_interval
+      self.segment_bytes = segment_bytes
+      self.put_timeout = put_timeout
+      self.queue = queue.Queue(maxsize=max_pending)
+      self.segment: Optional[pathlib.Path] = None
+      self.segments = 0
+      self.counters = {
+         "enqueued_batches": 0, "enqueued_messages": 0, "written_messages": 0,
+         "dropped_batches": 0, "dropped_messages": 0, "flushes": 0, "bytes_written": 0,
+         "errors": 0, "max_queue_depth": 0, "put_wait_s": 0.0,
+      }
+      self.last_error: Optional[str] = None
+      self._lock = threading.Lock()
+      self._closed = False
+      self._thread = threading.Thread(target=self._run, name=f"archive-{name}", daemon=True)
+      self._thread.start()
+      atexit.register(self.close)
+
+   def __call__(self, batch: List[Dict], thread_id: str) -> None:
+      if self._closed or not batch:
+         return
+      started = time.perf_counter()
+      try:
+         self.queue.put((thread_id, batch), timeout=self.put_timeout)
+         dropped = False
+      except queue.Full:
+         dropped = True
+      with self._lock:
+         self.counters["put_wait_s"] += time.perf_counter() - started
+         if dropped:
+            self.counters["dropped_batches"] += 1
+            self.counters["dropped_messages"] += len(batch)
+         else:
+            self.counters["enqueued_batches"] += 1
+            self.counters["enqueued_messages"] += len(batch)
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue.qsize())
+
+   def _run(self):
+      lines: List[str] = []
+      deadline = time.monotonic() + self.flush_interval
+      while True:
+         try:
+            item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+         except queue.Empty:
+            item = None
+         if item is _STOP:
+            self._flush(lines)
+            return
+         if item is not None:
+            thread_id, batch = item
+            lines += [json.dumps({"thread_id": thread_id, "message": m}, separators=(",", ":"), default=str) for m in batch]
+         if len(lines) >= self.flush_messages or time.monotonic() >= deadline:
+            self._flush(lines)
+            lines = []
+            deadline = time.monotonic() + self.flush_interval
+
+   def _next_segment(self) -> pathlib.Path:
+      self.segments += 1
+      stamp = time.strftime("%Y%m%dT%H%M%S")
+      return self.directory / f"{self.name}-{stamp}-{self.segments:05d}.jsonl.gz"
+
+   def _flush(self, lines: List[str]) -> None:
+      if not lines:
+         return
+      try:
+         if self.segment is None or (self.segment.exists() and self.segment.stat().st_size >= self.segment_bytes):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.segment = self._next_segment()
+         data = ("\n".join(lines) + "\n").encode("utf-8")
+         # one gzip member per flush: a crash loses at most the unflushed buffer, never a finished member
+         with gzip.open(self.segment, "ab") as f:
+            f.write(data)
+         with self._lock:
+            self.counters["written_messages"] += len(lines)
+            self.counters["flushes"] += 1
+            self.counters["bytes_written"] += len(data)
+      except Exception as e:
+         # the buffer is lost with the failed write: count it, so written + dropped covers every message handed in
+         with self._lock:
+            self.counters["errors"] += 1
+            self.counters["dropped_messages"] += len(lines)
+         self.last_error = repr(e)
+
+   def close(self, timeout: Optional[float] = None) -> None:
+      """Stop accepting batches, write out everything queued and wait for the writer thread."""
+      if self._closed:
+         return
+      self._closed = True
+      self.queue.put(_STOP)
+      self._thread.join(timeout)
+
+   def stats(self) -> dict:
+      with self._lock:
+         out = dict(self.counters)
+      out.update({"queue_depth": self.queue.qsize(), "segments": self.segments,
+                  "segment": str(self.segment) if self.segment else None, "last_error": self.last_error})
+      return out
+
+
+if __name__ == '__main__':
+   import tempfile
+
+   with tempfile.TemporaryDirectory() as tmp:
+      writer = ArchiveWriter(tmp, flush_messages=100, segment_bytes=4096)
+      started = time.perf_counter()
+      for i in range(2000):
+         writer([{"role": "user", "content": f"message {i}", "ts": time.time()}], f"thread-{i % 8}")
+      print(f"enqueue: {(time.perf_counter() - started) * 1e6 / 2000:.1f} us/batch")
+      writer.close()
+      print(writer.stats())
+      print(sorted(p.name for p in pathlib.Path(tmp).iterdir()))
@@ -0,0 +1,12 @@
+import time
+
+
+def best_of(fn, repeat: int = 3, number: int = 1) -> float:
+   """Best wall time in seconds of `number` calls to fn, over `repeat` rounds."""
+   best = float("inf")
+   for _ in range(repeat):
+      started = time.perf_counter()
+      for _ in range(number):
+         fn()
+      best = min(best, (time.perf_counter() - started) / number)
+   return best
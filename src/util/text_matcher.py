@@ -0,0 +1,145 @@
+import re
+from typing import Iterable
+
+_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+
+
+def _scoped(pattern: re.Pattern) -> str:
+   """The pattern as a group carrying its own flags, so patterns with different flags can share one regex."""
+   flags = "".join(c for flag, c in _INLINE_FLAGS if pattern.flags & flag)
+   return f"(?{flags}:{pattern.pattern})" if flags else f"(?:{pattern.pattern})"
+
+
+def _word_anchored(pattern: re.Pattern) -> bool:
+   """
+   True when every match starts at \\b: the source opens with \\b and has no top-level | (\\bfoo|bar is not
+   anchored). Read with a small scan of the source instead of re's private parser; verbose patterns are left out.
+   """
+   src = pattern.pattern
+   if not isinstance(src, str) or pattern.flags & re.VERBOSE or not src.startswith(r"\b"):
+      return False
+   depth, i = 0, 2
+   while i < len(src):
+      c = src[i]
+      if c == "\\":
+         i += 1
+      elif c == "[":
+         # skip the class up to its closing ]; a ] right after [ or [^ is a literal
+         i += 1
+         if src[i:i + 1] == "^":
+            i += 1
+         if src[i:i + 1] == "]":
+            i += 1
+         while i < len(src) and src[i] != "]":
+            i += 2 if src[i] == "\\" else 1
+      elif c == "(":
+         depth += 1
+      elif c == ")":
+         depth -= 1
+      elif c == "|" and depth == 0:
+         return False
+      i += 1
+   return True
+
+
+def _embeddable(pattern: re.Pattern) -> bool:
+   """ASCII patterns have another \\b, and global inline flags ((?i)...) cannot sit inside a group."""
+   if pattern.flags & re.ASCII:
+      return False
+   try:
+      re.compile(_scoped(pattern))
+   except re.error:
+      return False
+   return True
+
+
+def _compile(patterns: dict[str, str | re.Pattern], flags: int) -> dict[str, re.Pattern]:
+   return {name: p if isinstance(p, re.Pattern) else re.compile(p, flags) for name, p in patterns.items()}
+
+
+class TextMatcher:
+   """
+   A set of regexes compiled once and shared, with the keyword-style ones matched in a single pass:
+     - `words` are patterns whose every match starts at a word boundary (\\bkeyword, \\b(a|b), \\b\\d+ ...).
+       They are joined into one alternation \\b(?:(?P<w0>p0)|(?P<w1>p1)|...), so one search in C skips
+       everything up to the next word start where any of them matches.
+     - At such a position, the alternation of the patterns after the one that matched is tried there, until none
+       is left (the ones before it already failed there). The search resumes one character later, so matches
+       starting inside another pattern's match are still found.
+     - `others` (URLs, e-mails, unanchored patterns) run on their own finditer.
+   scan(text) returns the same as {name: list(pattern.finditer(text))}: non-overlapping per pattern, leftmost
+   first. Word patterns keep their own flags, must not match the empty string and must not use numbered
+   backreferences. `words` entries that do not start with \\b (or have a top-level |), verbose, ASCII ones and
+   ones with global inline flags run on their own. With fewer than `min_shared` word patterns asked for, the
+   alternation does not pay off and each runs on its own.
+   """
+   min_shared = 3
+
+   def __init__(self, words: dict[str, str | re.Pattern], others: dict[str, str | re.Pattern] | None = None,
+                flags: int = 0):
+      self.patterns = {**_compile(words, flags), **_compile(others or {}, flags)}
+      self.names = list(self.patterns)
+      self.compiled = list(self.patterns.values())
+      self.word_ids = [i for i, name in enumerate(self.names)
+                       if name in words and _word_anchored(self.compiled[i]) and _embeddable(self.compiled[i])]
+      groups = [f"(?P<w{i}>{_scoped(self.compiled[i])})" for i in self.word_ids]
+      # word_scanners[k] is the alternation of the word patterns from the k-th on; [0] is the shared scanner
+      self.word_scanners = [re.compile(r"\b(?:" + "|".join(groups[k:]) + ")") for k in range(len(groups))]
+      self.group_ids = {f"w{i}": i for i in self.word_ids}
+      self.rank = {i: k for k, i in enumerate(self.word_ids)}
+
+   def _scan_words(self, text: str, wanted: set[int], hits: dict[int, list[re.Match]]):
+      next_allowed = dict.fromkeys(wanted, 0)
+      search, last = self.word_scanners[0].search, len(self.word_scanners) - 1
+      pos = 0
+      while (found := search(text, pos)) is not None:
+         start = found.start()
+         # every word pattern matching here, in alternation order: each match asks the alternatives after it
+         while found is not None:
+            i = self.group_ids[found.lastgroup]
+            if i in wanted and start >= next_allowed[i]:
+               m = self.compiled[i].match(text, start)
+               hits[i].append(m)
+               next_allowed[i] = m.end()
+            k = self.rank[i]
+            found = self.word_scanners[k + 1].match(text, start) if k < last else None
+         pos = start + 1
+
+   def scan(self, text: str, names: Iterable[str] | None = None) -> dict[str, list[re.Match]]:
+      wanted = set(range(len(self.names))) if names is None else {self.names.index(n) for n in names}
+      hits: dict[int, list[re.Match]] = {i: [] for i in sorted(wanted)}
+      shared = wanted.intersection(self.word_ids)
+      if len(shared) >= self.min_shared:
+         self._scan_words(text, shared, hits)
+      else:
+         shared = set()
+      for i in wanted - shared:
+         hits[i] = list(self.compiled[i].finditer(text))
+      return {self.names[i]: found for i, found in hits.items()}
+
+
+def benchmark_matcher(matcher: TextMatcher, texts: list[str], repeat: int = 5) -> dict:
+   """Per-message cost of the shared single pass vs running every pattern on its own."""
+   import timeit
+
+   patterns = list(matcher.patterns.values())
+   per_pattern = min(timeit.repeat(lambda: [[list(p.finditer(t)) for p in patterns] for t in texts], number=1, repeat=repeat))
+   single_pass = min(timeit.repeat(lambda: [matcher.scan(t) for t in texts], number=1, repeat=repeat))
+   report = {"patterns": len(patterns), "word_patterns": len(matcher.word_ids), "messages": len(texts),
+             "per_pattern_us": per_pattern * 1e6 / len(texts), "single_pass_us": single_pass * 1e6 / len(texts),
+             "speedup": per_pattern / single_pass}
+   print(report)
+   return report
+
+
+if __name__ == '__main__':
+   import random
+
+   from src.subprocesses.analyze_meaning import MEANING_MATCHER
+
+   random.seed(7)
+   vocab = ("the deploy of service failed at step because image pull timed out and we should retry it tomorrow "
+            "with a warm cache please check logs for errors").split()
+   texts = [" ".join(random.choice(vocab) for _ in range(random.randint(8, 60))) + random.choice(["", "?", "."])
+            for _ in range(1000)]
+   benchmark_matcher(MEANING_MATCHER, texts)
@@ -1,3 +1,4 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
@@ -14,13 +15,20 @@ class Workflow:
       self._ct = kwargs.get("cancellation_token", CancellationToken())
       graph = StateGraph(ChatbotState)
 
-      graph.add_node("input", InputNode.get_input)
-      graph.add_node('generate_output', GenerateOutputNode.generate_output)
-      graph.add_node('stm', StmNode.retrieve_stm)
-      graph.add_node('update_history', UpdateHistoryNode.update_history)
+      # every node carries a sync and an async implementation, graph.invoke/ainvoke picks the matching one
+      graph.add_node('generate_output', RunnableLambda(GenerateOutputNode.generate_output, afunc=GenerateOutputNode.agenerate_output))
+      graph.add_node('stm', RunnableLambda(StmNode.retrieve_stm, afunc=StmNode.aretrieve_stm))
+      graph.add_node('update_history', RunnableLambda(UpdateHistoryNode.update_history, afunc=UpdateHistoryNode.aupdate_history))
 
-      graph.add_edge(START, 'input')
-      graph.add_edge('input', 'stm')
+      # sessions served by the SessionManager arrive with user_input already set and skip the input node
+      # stm is skipped when nothing new reached the history and the rendered STM is unchanged
+      stm_route = {True: 'stm', False: 'generate_output'}
+      if kwargs.get("interactive", True):
+         graph.add_node("input", RunnableLambda(InputNode.get_input, afunc=InputNode.aget_input))
+         graph.add_edge(START, 'input')
+         graph.add_conditional_edges('input', StmNode.needs_stm, stm_route)
+      else:
+         graph.add_conditional_edges(START, StmNode.needs_stm, stm_route)
       graph.add_edge('stm', 'generate_output')
       graph.add_edge('generate_output', 'update_history')
       graph.add_edge('update_history', END)
@@ -33,3 +41,10 @@ class Workflow:
          state = self.graph.invoke(state, {"recursion_limit": 100})
          iterations += 1
       return state
+
+   async def arun(self, state: ChatbotState, itearation_limit: int = 0) -> ChatbotState:
+      iterations = 0
+      while not self._ct.is_canceled() and not (itearation_limit <= iterations):
+         state = await self.graph.ainvoke(state, {"recursion_limit": 100})
+         iterations += 1
+      return state
@@ -0,0 +1,85 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from src.analysis_manager import AnalysisManager
+
+DAY1, DAY2 = datetime(2025, 10, 1, 23, 59), datetime(2025, 10, 2, 0, 1)
+
+
+class FakeModels:
+   """meaning_many/intent_batch stand-ins: the meaning records the reference date it was computed for."""
+
+   def __init__(self):
+      self.calls = 0
+      self.fail = False
+      self.during = None
+
+   def meaning_many(self, texts, *, now):
+      self.calls += 1
+      if self.during:
+         self.during()
+      if self.fail:
+         raise RuntimeError("model down")
+      return [{"text": t, "day": now.date().isoformat()} for t in texts]
+
+   @staticmethod
+   def intent_batch(texts, meanings):
+      return [{"intent": "info"} for _ in texts]
+
+
+@pytest.fixture
+def models():
+   return FakeModels()
+
+
+@pytest.fixture
+def manager(models):
+   # an instance of its own, not the process-wide singleton
+   am = object.__new__(AnalysisManager)
+   am.__init__()
+   am.meaning_many, am.intent_batch = models.meaning_many, models.intent_batch
+   am.clock = lambda: DAY1
+   return am
+
+
+def test_relative_dates_are_recomputed_on_a_new_day(manager, models):
+   m = {"role": "user", "content": "due tomorrow"}
+   assert manager.analyze(m).meaning["day"] == "2025-10-01"
+   assert manager.analyze(m).meaning["day"] == "2025-10-01"
+   manager.clock = lambda: DAY2
+   assert manager.lookup(m) is None
+   assert manager.analyze(m).meaning["day"] == "2025-10-02"
+   assert models.calls == 2 and manager.stats()["analyses"] == 2
+
+
+def test_failures_are_cached_for_failure_ttl(manager, models):
+   m = {"role": "user", "content": "hello"}
+   models.fail = True
+   assert manager.analyze(m) is None
+   assert manager.analyze(m) is None
+   assert models.calls == 1
+   assert manager.stats()["failure_hits"] == 1 and manager.stats()["failed"] == 1
+
+   manager.failure_ttl = 0
+   manager.failures.clear()
+   assert manager.analyze(m) is None
+   models.fail = False
+   assert manager.analyze(m).meaning["text"] == "hello"
+   assert models.calls == 3 and manager.stats()["failed"] == 0
+
+
+def test_models_run_outside_the_lock(manager, models):
+   acquired = []
+
+   def other_session():
+      # another thread must get the cache lock while the models run
+      got = manager._lock.acquire(timeout=1)
+      acquired.append(got)
+      if got:
+         manager._lock.release()
+
+   models.during = lambda: (t := threading.Thread(target=other_session), t.start(), t.join())
+   manager.analyze({"role": "user", "content": "hi"})
+   assert acquired == [True]
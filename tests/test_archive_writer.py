@@ -0,0 +1,28 @@
+from src.util.archive_writer import ArchiveWriter
+
+
+def batch(n: int) -> list[dict]:
+   return [{"role": "user", "content": f"message {i}"} for i in range(n)]
+
+
+def test_written_and_dropped_cover_every_message(tmp_path):
+   writer = ArchiveWriter(tmp_path, flush_messages=10)
+   for _ in range(5):
+      writer(batch(4), "t")
+   writer.close()
+   stats = writer.stats()
+   assert stats["written_messages"] == stats["enqueued_messages"] == 20
+   assert stats["dropped_messages"] == 0
+
+
+def test_failed_write_counts_its_lines_as_dropped(tmp_path):
+   blocker = tmp_path / "not-a-dir"
+   blocker.write_text("")
+   writer = ArchiveWriter(blocker / "archive", flush_messages=10)
+   for _ in range(5):
+      writer(batch(4), "t")
+   writer.close()
+   stats = writer.stats()
+   assert stats["errors"] > 0 and stats["last_error"]
+   assert stats["written_messages"] == 0
+   assert stats["written_messages"] + stats["dropped_messages"] == stats["enqueued_messages"] == 20
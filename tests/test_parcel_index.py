@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.memory_manager import MemoryManager
+from src.prompt_manager import ParcelIndex, _rank_scalar, _rank_vectorized, _synthetic_parcels, index_ts_to_turn, select_salient_from_stm
+
+NOW = datetime(2025, 10, 1, 12, tzinfo=timezone.utc)
+HISTORY = [{"role": "user", "content": f"m{i}", "timestamp": f"ts{i}"} for i in range(200)]
+
+
+def parcel(predicate: str, value: str, subject: str = "user") -> dict:
+   return {"subject": subject, "predicate": predicate, "value": value, "confidence": 0.9, "stability": 0.8}
+
+
+def test_multi_valued_predicates_do_not_conflict():
+   index = ParcelIndex([parcel("likes", "pizza"), parcel("likes", "cats"), parcel("mood", "tired"), parcel("mood", "happy")])
+   assert not index.has_conflict("user", "likes")
+   assert not index.has_conflict("user", "mood")
+   assert not index.memory_conflict
+   assert {p["value"] for p in index.values_for("user", "likes")} == {"pizza", "cats"}
+
+
+def test_single_valued_predicate_conflicts():
+   index = ParcelIndex([parcel("deadline", "friday"), parcel("deadline", "monday")])
+   assert index.has_conflict("user", "deadline")
+   assert index.memory_conflict
+
+
+def test_same_value_merges_without_conflict():
+   index = ParcelIndex([parcel("deadline", "Friday"), parcel("deadline", " friday ")])
+   assert len(index) == 1
+   assert not index.memory_conflict
+
+
+def test_store_stm_flags_only_real_conflicts():
+   mm = MemoryManager()
+   mm.drop_stm("test-parcels")
+   liked = {"parcels_draft": [parcel("likes", "pizza"), parcel("likes", "cats")]}
+   mm.store_stm([liked], thread_id="test-parcels")
+   assert not liked.get("flags", {}).get("memory_conflict")
+
+   moved = {"parcels_draft": [parcel("deadline", "friday"), parcel("deadline", "monday")]}
+   mm.store_stm([moved], thread_id="test-parcels")
+   assert moved["flags"]["memory_conflict"] is True
+   mm.drop_stm("test-parcels")
+
+
+@pytest.mark.parametrize("n", [0, 1, 50, 2_000])
+@pytest.mark.parametrize("recent_turns", [set(), set(range(192, 200))])
+@pytest.mark.parametrize("slot_boosts", [set(), {"deadline", "likes"}])
+def test_vectorized_ranking_matches_scalar(n, recent_turns, slot_boosts):
+   index = ParcelIndex(_synthetic_parcels(n, NOW, seed=n))
+   for k in (1, 10, 1_000):
+      kwargs = dict(ts2turn=index_ts_to_turn(HISTORY), now=NOW, recent_turns=recent_turns, slot_boosts=slot_boosts, k=k)
+      assert _rank_vectorized(index.columns, **kwargs) == _rank_scalar(index.parcels(), **kwargs)
+
+
+def test_select_salient_paths_agree():
+   parcels = _synthetic_parcels(500, NOW)
+   select = lambda **kwargs: select_salient_from_stm(history=HISTORY, now=NOW, intent={"missing_slots": ["deadline"]}, **kwargs)
+   expected = select(parcels=parcels, vectorized=False)
+   assert len(expected) == 10
+   assert select(parcels=parcels) == expected
+   assert select(index=ParcelIndex(parcels)) == expected
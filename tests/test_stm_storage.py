@@ -0,0 +1,179 @@
+import fakeredis
+import pytest
+
+from src.nodes.n03_memory.n01_stm_node import InMemorySTMStorage, RedisSTMStorage
+
+TID, OTHER = "conformance", "conformance-other"
+
+
+class FakeClock:
+   def __init__(self):
+      self.now = 1000.0
+
+   def __call__(self) -> float:
+      return self.now
+
+   def advance(self, seconds: float):
+      self.now += seconds
+
+
+def redis_advance(pool):
+   """Moves a fakeredis server's TTLs forward, the Redis side of an injected clock."""
+   r = fakeredis.FakeRedis(connection_pool=pool)
+
+   def advance(seconds: float):
+      for key in r.keys("*"):
+         left = r.pttl(key)
+         if left < 0:
+            continue
+         if left <= seconds * 1000:
+            r.delete(key)
+         else:
+            r.pexpire(key, left - int(seconds * 1000))
+
+   return advance
+
+
+@pytest.fixture
+def redis_pool():
+   return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True).connection_pool
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, redis_pool):
+   """(make, advance): make(**kwargs) builds the backend, advance(seconds) moves its clock."""
+   if request.param == "memory":
+      clock = FakeClock()
+      return (lambda **kwargs: InMemorySTMStorage(clock=clock, **kwargs)), clock.advance
+   return (lambda **kwargs: RedisSTMStorage(pool=redis_pool, **kwargs)), redis_advance(redis_pool)
+
+
+@pytest.fixture
+def archived():
+   return []
+
+
+@pytest.fixture
+def storage(backend, archived):
+   make, _ = backend
+   return make(prefix="stm-conformance:", ttl=None, max_messages=3, archive_sink=lambda batch, t: archived.append((t, len(batch))))
+
+
+def msg(i):
+   return {"role": "user", "content": f"message {i}", "ts": 0}
+
+
+def contents(msgs):
+   return [m["content"] for m in msgs]
+
+
+def batch(*names):
+   return [{"role": "user", "content": name} for name in names]
+
+
+def test_dedupe_within_and_across_batches(storage, archived):
+   assert storage.append_messages_batch(TID, [msg(0), msg(1), msg(0)]) == [True, True, False]
+   assert storage.append_messages_idempotent(TID, [msg(1), msg(2)]) == 1
+   # the archive only sees appended messages
+   assert archived == [(TID, 2), (TID, 1)]
+   assert contents(storage.load_messages(TID)) == ["message 0", "message 1", "message 2"]
+   assert storage.load_messages(TID)[0] == msg(0)
+
+
+def test_trim_keeps_newest_and_trimmed_stay_duplicates(storage):
+   storage.append_messages_idempotent(TID, [msg(i) for i in range(5)])
+   assert contents(storage.load_messages(TID)) == ["message 2", "message 3", "message 4"]
+   assert storage.append_messages_idempotent(TID, [msg(0)]) == 0
+   assert contents(storage.load_messages(TID, last_n=2)) == ["message 3", "message 4"]
+   assert contents(storage.load_recent(TID, 1)) == ["message 4"]
+   assert storage.load_messages(TID, last_n=0) == [] and storage.load_recent(TID, 0) == []
+
+
+def test_load_since_counts_trimmed_messages(storage):
+   storage.append_messages_idempotent(TID, [msg(i) for i in range(5)])
+   total, fresh = storage.load_since(TID, 3)
+   assert total == 5 and contents(fresh) == ["message 3", "message 4"]
+   assert contents(storage.load_since(TID, 0)[1]) == ["message 2", "message 3", "message 4"]
+   assert storage.load_since(TID, 5) == (5, [])
+
+
+def test_append_pipelined_matches_per_thread_batches(storage):
+   outcomes = storage.append_messages_pipelined({TID: [msg(0), msg(0)], OTHER: [msg(1)], "empty": []})
+   assert outcomes == {TID: [True, False], OTHER: [True]}
+   assert contents(storage.load_messages(OTHER)) == ["message 1"]
+
+
+def test_threads_are_isolated(storage):
+   storage.append_messages_idempotent(TID, [msg(0)])
+   storage.merge_slots(TID, {"step": 1})
+   assert storage.load_messages(OTHER) == []
+   assert storage.load_since(OTHER) == (0, [])
+   assert storage.get_slots(OTHER) == {}
+
+
+def test_slots_deep_merge(storage):
+   first = {"task": "fix login", "temp_prefs": {"style": "terse"}}
+   assert storage.merge_slots(TID, first) == first
+   expected = {"task": "fix login", "temp_prefs": {"style": "terse", "lang": "en"}, "step": 2}
+   assert storage.merge_slots(TID, {"temp_prefs": {"lang": "en"}, "step": 2}) == expected
+   assert storage.get_slots(TID) == expected
+   assert storage.merge_slots(TID, {}) == expected
+
+
+def test_clear_all_drops_messages_seen_sequence_and_slots(storage):
+   storage.append_messages_idempotent(TID, [msg(0)])
+   storage.merge_slots(TID, {"step": 1})
+   storage.clear_all(TID)
+   assert storage.load_messages(TID) == []
+   assert storage.get_slots(TID) == {}
+   assert storage.load_since(TID) == (0, [])
+   assert storage.append_messages_idempotent(TID, [msg(0)]) == 1
+
+
+def test_ttl_covers_messages_seen_set_and_slots(backend):
+   make, advance = backend
+   storage = make(prefix="stm-conformance:", ttl=60, max_messages=3)
+   storage.append_messages_idempotent(TID, [msg(0)])
+   storage.merge_slots(TID, {"step": 1})
+   advance(30)
+   assert contents(storage.load_messages(TID)) == ["message 0"]
+   assert storage.get_slots(TID) == {"step": 1}
+   advance(31)
+   assert storage.load_messages(TID) == []
+   assert storage.get_slots(TID) == {}
+   assert storage.load_since(TID) == (0, [])
+   assert storage.append_messages_idempotent(TID, [msg(0)]) == 1
+
+
+def test_append_refreshes_ttl(backend):
+   make, advance = backend
+   storage = make(prefix="stm-conformance:", ttl=60, max_messages=3)
+   storage.append_messages_idempotent(TID, [msg(0)])
+   advance(50)
+   storage.append_messages_idempotent(TID, [msg(1)])
+   advance(50)
+   assert contents(storage.load_messages(TID)) == ["message 0", "message 1"]
+   assert storage.append_messages_idempotent(TID, [msg(0)]) == 0
+
+
+def test_cached_load_resets_after_clear_by_another_worker(redis_pool):
+   reader, writer = RedisSTMStorage(pool=redis_pool), RedisSTMStorage(pool=redis_pool)
+   writer.append_messages_idempotent("t", batch("old0", "old1"))
+   assert contents(reader.load_messages_cached("t")) == ["old0", "old1"]
+
+   # at least as many new messages as the reader's seq: the counter alone cannot tell the epochs apart
+   writer.clear_messages("t")
+   writer.append_messages_idempotent("t", batch("new0", "new1", "new2"))
+   assert contents(reader.load_messages_cached("t")) == ["new0", "new1", "new2"]
+
+   writer.append_messages_idempotent("t", batch("new3"))
+   assert contents(reader.load_messages_cached("t")) == contents(reader.load_messages("t"))
+
+
+def test_cached_load_resets_after_expiry(redis_pool):
+   storage = RedisSTMStorage(pool=redis_pool, ttl=60)
+   storage.append_messages_idempotent("t", batch("old0", "old1"))
+   storage.load_messages_cached("t")
+   redis_advance(redis_pool)(61)
+   storage.append_messages_idempotent("t", batch("new0", "new1"))
+   assert contents(storage.load_messages_cached("t")) == ["new0", "new1"]
@@ -0,0 +1,57 @@
+import random
+import re
+
+import pytest
+
+from src.subprocesses.analyze_meaning import MEANING_MATCHER
+from src.util.text_matcher import TextMatcher
+
+WORDS = ("today tomorrow day after eod end of next week monday Friday nextmonday next\tfriday http://x.io/a?b=1 a@b.com "
+         "a@b.co.uk 12 3.5 3days days hrs % 7% percent how what WHEN why should make create fix fixing debug step "
+         "ß ſ K é 日本 ٣ __ x1 today.tomorrow").split()
+
+
+def random_texts(n: int, seed: int = 1) -> list[str]:
+   rng = random.Random(seed)
+   texts = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 30))) for _ in range(n)]
+   # glued words: matches start inside other matches and right after non-word characters
+   texts += ["".join(rng.choice(WORDS) + rng.choice(["", " ", ".", "-", "\n"]) for _ in range(20)) for _ in range(n)]
+   return texts
+
+
+def spans(matches) -> list:
+   return [(m.span(), m.groups()) for m in matches]
+
+
+@pytest.mark.parametrize("names", [None, ["number"], ["question", "command", "url"], ["date:today", "date:tomorrow", "date:day after tomorrow"]])
+def test_meaning_scan_matches_per_pattern_finditer(names):
+   for text in random_texts(500):
+      hits = MEANING_MATCHER.scan(text, names)
+      assert list(hits) == (names or MEANING_MATCHER.names)
+      for name, found in hits.items():
+         assert spans(found) == spans(MEANING_MATCHER.patterns[name].finditer(text)), (name, text)
+
+
+def test_mixed_flags_and_unshareable_patterns():
+   matcher = TextMatcher({
+      "ab": r"\bab",
+      "abc": r"\babc\w*",
+      "b": r"\bb",
+      "B": re.compile(r"\bB\w", re.I),
+      "inline": r"(?i)\bAB",  # global inline flags cannot sit inside the shared alternation
+      "ascii": re.compile(r"\bé", re.A),  # another \b than the shared scanner's
+   }, others={"any-b": "b"})
+   assert [matcher.names[i] for i in matcher.word_ids] == ["ab", "abc", "b", "B"]
+   for text in ["ab abc Abc éb b", "xéab", "abcab ab", "Bb bb ab"]:
+      for name, found in matcher.scan(text).items():
+         assert spans(found) == spans(matcher.patterns[name].finditer(text)), (name, text)
+
+
+def test_words_without_leading_word_boundary_run_on_their_own():
+   matcher = TextMatcher({"a": r"foo", "b": r"\bbar", "c": r"\bbaz", "d": r"\bqux|foo", "e": r"\b[]|]x"})
+   assert [matcher.names[i] for i in matcher.word_ids] == ["b", "c", "e"]
+   text = "xfoo bar baz quxfoo ]x"
+   for name, pattern in matcher.patterns.items():
+      expected = spans(pattern.finditer(text))
+      assert spans(matcher.scan(text)[name]) == expected
+      assert spans(matcher.scan(text, names=[name])[name]) == expected
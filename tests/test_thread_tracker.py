@@ -0,0 +1,95 @@
+import random
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.prompt_manager import (ACK_PATTERNS, CANCEL_PATTERNS, REQ_PATTERNS, RESOLVE_PATTERNS, ThreadTracker, _channel,
+                                _intent_is_request, _is_assistant, _is_user_interactive, _missing_slots, _title_from, _ts,
+                                extract_open_threads)
+from src.session_manager import Session, new_state
+
+USER_TEXTS = ["can you fix the login?", "please write a summary", "what is the SLA", "ok", "thanks!", "nevermind",
+              "forget it", "I like cats", "cheers, that works", "hmm", "where is the report", "debug step 3\nnow"]
+ASSISTANT_TEXTS = ["done, fixed it", "here you go", "let me think", "sure", "summary: all good", "working on it"]
+INTENTS = ["action", "info", "clarification", "chitchat", "feedback"]
+
+
+def scan_open_threads(history, stale_after_turns=12):
+   """The full rescan extract_open_threads did before ThreadTracker: every candidate walks forward to its closure."""
+   candidates = []
+   for i, m in enumerate(history):
+      if not _is_user_interactive(m):
+         continue
+      if not (REQ_PATTERNS.search(m.get("content") or "") or _intent_is_request(m)):
+         continue
+      candidates.append({"id": f"thr-{i}", "turn": i, "title": _title_from(m), "status": "open", "timestamp": _ts(m) or None,
+                         "channel": _channel(m), "missing_slots": _missing_slots(m) or []})
+   for c in candidates:
+      for m in history[c["turn"] + 1:]:
+         txt = m.get("content") or ""
+         if (_is_assistant(m) and RESOLVE_PATTERNS.search(txt)) or \
+               (_is_user_interactive(m) and (ACK_PATTERNS.search(txt) or CANCEL_PATTERNS.search(txt))):
+            c["status"] = "closed"
+            break
+   last_turn = len(history) - 1
+   return [{**c, "since_turns": max(0, last_turn - c["turn"]), "stale": max(0, last_turn - c["turn"]) >= stale_after_turns}
+           for c in candidates if c["status"] == "open"]
+
+
+def random_message(rng: random.Random, i: int) -> dict:
+   role = rng.choice(["user", "user", "assistant", "system"])
+   texts = USER_TEXTS if role == "user" else ASSISTANT_TEXTS
+   metadata = {
+      "event_type": rng.choice(["user.text", "user.voice", "system.timer"]),
+      "timestamp": f"2025-10-01T10:{i % 60:02d}:00Z" if rng.random() < 0.7 else None,
+      "channel": rng.choice(["terminal", "browser", None]),
+      # attached analyses, so the AnalysisManager (and its models) is never asked
+      "meaning": {"sentences": [rng.choice(texts)]} if rng.random() < 0.5 else {},
+      "intent": {"intent": rng.choice(INTENTS), "missing_slots": rng.choice([[], ["deadline"]])},
+   }
+   return {"role": role, "content": rng.choice(texts), "metadata": metadata}
+
+
+def random_history(seed: int) -> list[dict]:
+   rng = random.Random(seed)
+   return [random_message(rng, i) for i in range(rng.randint(0, 40))]
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_tracker_matches_full_scan(seed):
+   history = random_history(seed)
+   stale = seed % 15
+   assert extract_open_threads(history, stale_after_turns=stale) == scan_open_threads(history, stale)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_tracker_round_trip_mid_stream(seed):
+   history = random_history(seed)
+   cut = len(history) // 2
+   tracker = ThreadTracker.from_dict(ThreadTracker().consume_many(history[:cut]).to_dict())
+   assert tracker.consume_many(history[cut:]).open_threads() == scan_open_threads(history)
+
+
+def test_session_restore_resumes_tracking():
+   def chat(*texts):
+      return [HumanMessage(content=t) if i % 2 == 0 else AIMessage(content=t) for i, t in enumerate(texts)]
+
+   before = chat("can you fix the login?", "let me think", "please write a summary", "sure")
+   after = chat("what is the SLA", "working on it")
+   session = Session(thread_id="restore", state=new_state("restore"))
+   session.state['history'] = list(before)
+   session.track_threads()
+   session.turns = 2
+   snapshot = session.snapshot()
+
+   restored = Session(thread_id="restore", state=new_state("restore"))
+   restored.state['history'] = before + after
+   restored.restore(snapshot)
+   assert restored.turns == 2 and restored.threads.turns == len(before)
+   restored.track_threads()
+
+   fresh = Session(thread_id="restore", state=new_state("restore"))
+   fresh.state['history'] = before + after
+   fresh.track_threads()
+   assert restored.threads.open_threads() == fresh.threads.open_threads()
+   assert [t["turn"] for t in restored.threads.open_threads()] == [0, 2, 4]